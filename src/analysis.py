@@ -38,6 +38,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Columns load_data selects unless the caller asks for others
+DEFAULT_COLUMNS = [
+    'game_id', 'date', 'player_color', 'opponent_name', 'time_control',
+    'opening_name', 'event_name', 'result', 'player_rating', 'opponent_rating'
+]
+
 def log_execution_time(func):
     """Decorator to log execution time of functions."""
     @wraps(func)
@@ -120,7 +126,7 @@ class ChessAnalyzer:
         raise FileNotFoundError(f"Database {db_name} not found in any expected location")
     
     @log_execution_time
-    def load_data(self, date_filter: Optional[str] = None, limit: Optional[int] = None, event_name: Optional[str] = None, last_n: Optional[int] = None) -> None:
+    def load_data(self, date_filter: Optional[str] = None, limit: Optional[int] = None, event_name: Optional[str] = None, last_n: Optional[int] = None, columns: Optional[List[str]] = None) -> None:
         """
         Load game data from the database with optimized chunked reading and filtering.
         
@@ -129,23 +135,16 @@ class ChessAnalyzer:
             limit (int, optional): Maximum number of games to load
             event_name (str, optional): Filter by specific event name (takes priority over date_filter)
             last_n (int, optional): Load only the N most recent games
+            columns (list, optional): Columns to select (default DEFAULT_COLUMNS); fetch only what the caller uses
         """
         try:
             start_time = time.time()
             
             # Build query with optional filters
-            base_query = """
+            columns = columns or DEFAULT_COLUMNS
+            base_query = f"""
             SELECT 
-                game_id,
-                date,
-                player_color,
-                opponent_name,
-                time_control,
-                opening_name,
-                event_name,
-                result,
-                player_rating,
-                opponent_rating
+                {', '.join(columns)}
             FROM game_analysis
             """
             
@@ -236,13 +235,15 @@ class ChessAnalyzer:
                 # Convert date column to datetime
                 self.games_df['date'] = pd.to_datetime(self.games_df['date'])
                 
-                # Precompute commonly used columns
-                self.games_df['time_category'] = self.games_df['time_control'].apply(self.categorize_time_control)
-                self.games_df['opponent_rating_range'] = pd.cut(
-                    self.games_df['opponent_rating'],
-                    bins=[0, 1000, 1200, 1400, 1600, 1800, 2000, 3000],
-                    labels=['<1000', '1000-1200', '1200-1400', '1400-1600', '1600-1800', '1800-2000', '2000+']
-                )
+                # Precompute commonly used columns (from whichever source columns were loaded)
+                if 'time_control' in self.games_df.columns:
+                    self.games_df['time_category'] = self.games_df['time_control'].apply(self.categorize_time_control)
+                if 'opponent_rating' in self.games_df.columns:
+                    self.games_df['opponent_rating_range'] = pd.cut(
+                        self.games_df['opponent_rating'],
+                        bins=[0, 1000, 1200, 1400, 1600, 1800, 2000, 3000],
+                        labels=['<1000', '1000-1200', '1200-1400', '1400-1600', '1600-1800', '1800-2000', '2000+']
+                    )
                 
                 self._performance_metrics['data_load_time'] = time.time() - start_time
                 logger.info(f"Successfully loaded {len(self.games_df)} games")
@@ -1,14 +1,12 @@
 """
 Unified game analysis module combining Stockfish and GPT analysis.
 """
-import os
-import openai
+import atexit
 import chess.engine
 
 from config import GPT_MODEL, OPENAI_API_KEY, MAIN_LOG, CHESS_USERNAME
 from config import (
     STOCKFISH_PATH, 
-    OPENAI_API_KEY, 
     REPORTS_DIR,
     ANALYZER_LOG
 )
@@ -16,12 +14,15 @@ from utils import (
     log, 
     get_latest_pgn_path, 
     load_pgn_game,
+    read_pgn_text,
     extract_player_info, 
     extract_game_metadata
 )
 from openai import OpenAI
 
-openai.api_key = OPENAI_API_KEY
+# Shared client so repeated calls reuse the same connection pool
+client = OpenAI(api_key=OPENAI_API_KEY)
+atexit.register(client.close)
 
 def analyze_with_stockfish(game):
     """
@@ -103,13 +104,14 @@ def analyze_with_stockfish(game):
                 "Inaccuracies": "N/A"
             }
         }
-def build_prompt(game_pgn: str, stockfish_analysis: str, time_control: str) -> str:
-    return f"""
+
+# Analysis prompt, built once at import and filled in per game
+ANALYSIS_PROMPT = """
 You are a chess coach assistant. A game was just played under the following time control: {time_control}.
 
 Please provide a structured analysis of this game, keeping in mind that faster time controls like Bullet will naturally have more inaccuracies and blunders. Do not judge harshly for quick mistakes in those formats.
 
-The player's username is {CHESS_USERNAME}.
+The player's username is {username}.
 
 Use the following format:
 
@@ -121,11 +123,11 @@ Use the following format:
    - [In the future, a board image will be inserted before each critical moment.]
 
 3. **Highlights and Lowlights**
-   - For {CHESS_USERNAME}: one highlight and one lowlight (1 paragraph each)
+   - For {username}: one highlight and one lowlight (1 paragraph each)
    - For the opponent: one highlight and one lowlight (1 paragraph each)
 
 4. **Coaching Point**
-   - Recommend a specific skill or habit {CHESS_USERNAME} should focus on to improve future games.
+   - Recommend a specific skill or habit {username} should focus on to improve future games.
 
 Stockfish analysis:
 {stockfish_analysis}
@@ -134,13 +136,19 @@ PGN of the game:
 {game_pgn}
 """
 
+def build_prompt(game_pgn: str, stockfish_analysis: str, time_control: str) -> str:
+    return ANALYSIS_PROMPT.format(
+        time_control=time_control,
+        username=CHESS_USERNAME,
+        stockfish_analysis=stockfish_analysis,
+        game_pgn=game_pgn
+    )
+
 def analyze_game_with_gpt(game_pgn: str, stockfish_analysis: str, time_control: str) -> str:
     prompt = build_prompt(game_pgn, stockfish_analysis, time_control)
 
     log("🧠 Requesting game analysis from GPT...", MAIN_LOG)
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
     response = client.chat.completions.create(
         model=GPT_MODEL,
         messages=[
@@ -164,7 +172,8 @@ def generate_game_analysis():
         log("No PGN files found.", ANALYZER_LOG)
         return False
 
-    game, pgn_text = load_pgn_game(pgn_path)
+    game = load_pgn_game(pgn_path)
+    pgn_text = read_pgn_text(pgn_path)
     player_info = extract_player_info(game)
     metadata_dict = extract_game_metadata(game)
     stockfish_stats = analyze_with_stockfish(game)
@@ -214,10 +223,7 @@ def generate_game_analysis():
     """
 
     # Save the report
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-    report_path = os.path.join(REPORTS_DIR, "game_analysis.txt")
-    with open(report_path, "w", encoding="utf-8") as f:
-        f.write(final_report)
+    (REPORTS_DIR / "game_analysis.txt").write_text(final_report, encoding="utf-8")
 
     log("✅ Complete analysis (Stockfish + GPT) saved to game_analysis.txt", ANALYZER_LOG)
     return True
\ No newline at end of file
@@ -1,30 +1,82 @@
 import openai
 import os
-import datetime
+import json
+import atexit
+import logging
 import chess.pgn
-import io
 from dotenv import load_dotenv
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 USERNAME = os.getenv("CHESS_USERNAME")
 
+# Shared client so repeated calls reuse the same connection pool
+client = openai.OpenAI(api_key=OPENAI_API_KEY)
+atexit.register(client.close)
+
 REPORTS_DIR = "../reports"
 DATA_DIR = "../data"
 LOG_PATH = "../logs/analyzer.log"
 
+# Keep one log file handle open for the process instead of reopening per line
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(asctime)s] %(message)s",
+    handlers=[
+        logging.FileHandler(LOG_PATH, encoding="utf-8", delay=True),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
 def log(message):
-    timestamp = datetime.datetime.now()
-    print(f"[{timestamp}] {message}")
-    with open(LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
-
-def extract_player_info(pgn_text, user):
-    game = chess.pgn.read_game(io.StringIO(pgn_text))
-    white = game.headers.get("White", "")
-    black = game.headers.get("Black", "")
-    white_elo = game.headers.get("WhiteElo", "N/A")
-    black_elo = game.headers.get("BlackElo", "N/A")
+    logger.info(message)
+
+# Report prompt, built once at import and filled in per game
+ANALYZE_GAME_PROMPT = """
+You are a professional chess coach and report writer. Analyze the PGN below.
+
+Respond with a single JSON object with exactly these keys:
+- "summary": one paragraph summary of the game
+- "result": 1-0, 0-1, or 1/2-1/2 with short descriptor
+- "moves": number of moves
+- "time_control": time control format
+- "opening": opening name
+- "recommendations": list of two improvement ideas for {you}
+- "call_to_action": one motivational sentence
+
+PGN:
+{pgn_text}
+"""
+
+# Markdown report assembled locally, so the model doesn't have to echo the PGN back
+REPORT_TEMPLATE = """## Game Summary
+{summary}
+
+## Game Metadata
+- Your Name & Rating: {you}
+- Opponent: {opponent}
+- Color: {color}
+- Result: {result}
+- Moves: {moves}
+- Time Control: {time_control}
+- Opening: {opening}
+
+## Recommendations
+{recommendations}
+
+## Call to Action
+{call_to_action}
+
+## PGN
+{pgn_text}
+"""
+
+def extract_player_info(headers, user):
+    white = headers.get("White", "")
+    black = headers.get("Black", "")
+    white_elo = headers.get("WhiteElo", "N/A")
+    black_elo = headers.get("BlackElo", "N/A")
 
     if white.lower() == user.lower():
         return {
@@ -40,66 +92,61 @@ def extract_player_info(pgn_text, user):
         }
 
 def analyze_game(pgn_text, player_info):
-    prompt = f"""
-You are a professional chess coach and report writer. Analyze the PGN below and generate structured Markdown content.
-
-Use ONLY `##` headings for all sections. Do not use bold, italic, or any other formatting. Follow this template:
-
-## Game Summary
-[One paragraph summary]
-
-## Game Metadata
-- Your Name & Rating: {player_info['you']}
-- Opponent: {player_info['opponent']}
-- Color: {player_info['color']}
-- Result: [1-0, 0-1, or 1/2-1/2 with short descriptor]
-- Moves: [Number of moves]
-- Time Control: [Format]
-- Opening: [Opening name]
-
-## Recommendations
-1. [First improvement idea]
-2. [Second improvement idea]
-
-## Call to Action
-[One motivational sentence]
-
-## PGN
-{pgn_text}
-"""
+    prompt = ANALYZE_GAME_PROMPT.format(you=player_info['you'], pgn_text=pgn_text)
 
     try:
-        client = openai.Client(api_key=openai.api_key)
         response = client.chat.completions.create(
-            model="gpt-4",
+            model="gpt-4o",
             messages=[
-                {"role": "system", "content": "You write strict markdown reports."},
+                {"role": "system", "content": "You write concise chess reports as JSON."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1200,
+            response_format={"type": "json_object"},
+            max_tokens=600,
             temperature=0.7
         )
-        return response.choices[0].message.content
+        fields = json.loads(response.choices[0].message.content)
     except Exception as e:
         log(f"OpenAI error: {e}")
         return None
 
+    recommendations = fields.get("recommendations") or []
+    if isinstance(recommendations, str):
+        recommendations = [recommendations]
+
+    return REPORT_TEMPLATE.format(
+        summary=fields.get("summary", ""),
+        you=player_info['you'],
+        opponent=player_info['opponent'],
+        color=player_info['color'],
+        result=fields.get("result", "N/A"),
+        moves=fields.get("moves", "N/A"),
+        time_control=fields.get("time_control", "N/A"),
+        opening=fields.get("opening", "N/A"),
+        recommendations="\n".join(f"{i}. {idea}" for i, idea in enumerate(recommendations, 1)),
+        call_to_action=fields.get("call_to_action", ""),
+        pgn_text=pgn_text.strip()
+    )
+
 if __name__ == "__main__":
-    pgn_files = sorted(
-        [f for f in os.listdir(DATA_DIR) if f.endswith(".pgn")],
+    latest_pgn = max(
+        (f for f in os.listdir(DATA_DIR) if f.endswith(".pgn")),
         key=lambda x: os.path.getmtime(os.path.join(DATA_DIR, x)),
-        reverse=True
+        default=None
     )
-    if not pgn_files:
+    if not latest_pgn:
         log("No PGN files found.")
         exit()
 
-    pgn_path = os.path.join(DATA_DIR, pgn_files[0])
+    pgn_path = os.path.join(DATA_DIR, latest_pgn)
+    # Only the headers are needed for player info, so parse them straight from the file
     with open(pgn_path, "r", encoding="utf-8") as f:
+        headers = chess.pgn.read_headers(f)
+        f.seek(0)
         pgn_text = f.read()
 
     log(f"Starting game analysis for {os.path.basename(pgn_path)}")
-    player_info = extract_player_info(pgn_text, USERNAME)
+    player_info = extract_player_info(headers, USERNAME)
     report = analyze_game(pgn_text, player_info)
 
     if report:
@@ -1,25 +1,83 @@
 """
 Chess.com API interaction module for MAIgnus_CAIrlsen bot.
 """
-import os
-import hashlib
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from config import (
     CHESS_API_BASE_URL, 
     CHESS_API_HEADERS, 
     CHESS_USERNAME, 
     DATA_DIR, 
+    HTTP_CACHE_DIR,
     MAIN_LOG
 )
 from utils import log
 
+# Shared session so repeated Chess.com requests reuse one pooled connection
+SESSION = requests.Session()
+SESSION.headers.update(CHESS_API_HEADERS)
+
+# Upper bound on concurrent PGN file writes
+SAVE_WORKERS = 8
+
+def conditional_get_json(url, cache_name):
+    """
+    GET a JSON resource, revalidating against the cached copy when we have one.
+
+    Returns (status_code, data, cache_entry). A 304 response returns the cached body.
+    cache_entry holds a 200 response's body and validators (or is None); it is not stored here,
+    so callers save it with save_cache_entry once they have finished with the data.
+    """
+    # Cached response bodies and validators (ETag / Last-Modified) live in HTTP_CACHE_DIR
+    cache_path = HTTP_CACHE_DIR / f"{cache_name}.json"
+    cached = None
+    if cache_path.exists():
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        if cached and cached.get("url") != url:
+            cached = None
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = SESSION.get(url, headers=headers)
+
+    if response.status_code == 304 and cached:
+        return 304, cached["body"], None
+
+    if response.status_code != 200:
+        return response.status_code, None, None
+
+    body = response.json()
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not (etag or last_modified):
+        return 200, body, None
+    return 200, body, {"url": url, "etag": etag, "last_modified": last_modified, "body": body}
+
+def save_cache_entry(cache_name, cache_entry):
+    """
+    Store a response returned by conditional_get_json, so the next request can be revalidated.
+    """
+    if cache_entry is None:
+        return
+    with open(HTTP_CACHE_DIR / f"{cache_name}.json", "w", encoding="utf-8") as f:
+        json.dump(cache_entry, f)
+
 def get_player_profile(username=CHESS_USERNAME):
     """
     Fetch a player's profile data from Chess.com API.
     """
     url = f"{CHESS_API_BASE_URL}/{username}"
-    response = requests.get(url, headers=CHESS_API_HEADERS)
+    response = SESSION.get(url)
 
     if response.status_code == 200:
         return response.json()
@@ -32,32 +90,41 @@ def get_archives(username=CHESS_USERNAME):
     Fetch a player's game archives from Chess.com API.
     """
     url = f"{CHESS_API_BASE_URL}/{username}/games/archives"
-    response = requests.get(url, headers=CHESS_API_HEADERS)
+    status_code, data, cache_entry = conditional_get_json(url, "archives")
+    save_cache_entry("archives", cache_entry)
     
-    if response.status_code == 200:
-        archives = response.json().get('archives', [])
+    if data is not None:
+        archives = data.get('archives', [])
         log(f"Found {len(archives)} archives. Most recent: {archives[-1] if archives else 'None'}", MAIN_LOG)
         return archives
     else:
-        log(f"Error getting archives: {response.status_code}", MAIN_LOG)
+        log(f"Error getting archives: {status_code}", MAIN_LOG)
         return None
 
-def get_games_from_latest_archive(username=CHESS_USERNAME):
+def get_games_from_latest_archive(username=CHESS_USERNAME, skip_unchanged=False):
     """
     Fetch games from the most recent archive for a player.
+
+    Returns (games, cache_entry). With skip_unchanged, games is None when the archive is unchanged
+    since the last check (HTTP 304). The caller saves cache_entry under "latest_archive" only after
+    the games are stored, so a run that fails part way fetches the archive again next time.
     """
     archives = get_archives(username)
     if not archives:
         log("No archives found.", MAIN_LOG)
-        return []
+        return [], None
     
     latest_archive_url = archives[-1]  # Most recent month
     log(f"Checking latest archive: {latest_archive_url}", MAIN_LOG)
     
-    response = requests.get(latest_archive_url, headers=CHESS_API_HEADERS)
+    status_code, data, cache_entry = conditional_get_json(latest_archive_url, "latest_archive")
     
-    if response.status_code == 200:
-        games = response.json().get('games', [])
+    if data is not None:
+        if status_code == 304:
+            log("Latest archive unchanged since last check (HTTP 304)", MAIN_LOG)
+            if skip_unchanged:
+                return None, None
+        games = data.get('games', [])
         log(f"Found {len(games)} games in latest archive", MAIN_LOG)
         
         # Log the first few games to help with debugging
@@ -67,26 +134,36 @@ def get_games_from_latest_archive(username=CHESS_USERNAME):
                 end_time = game.get('end_time', 'Unknown')
                 log(f"Game {i+1}: URL={url}, End Time={end_time}", MAIN_LOG)
         
-        return games
+        return games, cache_entry
     else:
-        log(f"Error fetching games: {response.status_code}", MAIN_LOG)
-        return []
+        log(f"Error fetching games: {status_code}", MAIN_LOG)
+        return [], None
 
-SEEN_GAMES_FILE = os.path.join(DATA_DIR, "seen_games.json")
+SEEN_GAMES_FILE = DATA_DIR / "seen_games.json"
+
+def save_pgn(file_path, pgn):
+    """
+    Write a single game's PGN text to disk.
+    """
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(pgn)
+    return file_path
 
 def fetch_and_save_pgns(username=CHESS_USERNAME):
     """
     Fetch PGN files from Chess.com and save new ones based on game URL.
     """
-    games = get_games_from_latest_archive(username)
+    games, cache_entry = get_games_from_latest_archive(username, skip_unchanged=SEEN_GAMES_FILE.exists())
+    if games is None:
+        log("No new games since the last check.", MAIN_LOG)
+        return False
     if not games:
         log("No games found.", MAIN_LOG)
+        save_cache_entry("latest_archive", cache_entry)
         return False
 
-    os.makedirs(DATA_DIR, exist_ok=True)
-
     # Load already seen URLs
-    if os.path.exists(SEEN_GAMES_FILE):
+    if SEEN_GAMES_FILE.exists():
         with open(SEEN_GAMES_FILE, "r") as f:
             seen_urls = set(json.load(f))
         log(f"Loaded {len(seen_urls)} previously seen games from {SEEN_GAMES_FILE}", MAIN_LOG)
@@ -97,7 +174,8 @@ def fetch_and_save_pgns(username=CHESS_USERNAME):
     new_games_found = False
     new_seen_urls = set(seen_urls)  # so we can write back updated list
 
-    # This is the game processing loop I'm referring to
+    # Collect the new games first, then write their PGN files concurrently
+    to_save = []
     for game in games:
         url = game.get('url')
         pgn = game.get('pgn')
@@ -108,19 +186,26 @@ def fetch_and_save_pgns(username=CHESS_USERNAME):
         if url not in seen_urls:
             game_id = url.split("/")[-1]
             filename = f"{username}_{game_id}.pgn"
-            file_path = os.path.join(DATA_DIR, filename)
+            to_save.append((url, DATA_DIR / filename, pgn))
+        else:
+            log(f"Already analyzed: {url}", MAIN_LOG)
 
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(pgn)
+    if to_save:
+        with ThreadPoolExecutor(max_workers=min(SAVE_WORKERS, len(to_save))) as executor:
+            futures = [(url, executor.submit(save_pgn, file_path, pgn)) for url, file_path, pgn in to_save]
 
+        for url, future in futures:
+            file_path = future.result()
             log(f"✅ Saved new game: {file_path}", MAIN_LOG)
             new_seen_urls.add(url)
             new_games_found = True
-        else:
-            log(f"Already analyzed: {url}", MAIN_LOG)
 
-    # Save updated seen list
-    with open(SEEN_GAMES_FILE, "w") as f:
-        json.dump(list(new_seen_urls), f)
+    # Save updated seen list only when it actually changed
+    if new_games_found:
+        with open(SEEN_GAMES_FILE, "w") as f:
+            json.dump(list(new_seen_urls), f)
+
+    # Only now may the next run skip this archive on a 304: its games are saved and marked seen
+    save_cache_entry("latest_archive", cache_entry)
 
     return new_games_found
\ No newline at end of file
@@ -2,6 +2,7 @@
 Centralized configuration for MAIgnus_CAIrlsen chess analysis bot.
 """
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,25 +16,59 @@ CHESS_API_HEADERS = {
 CHESS_USERNAME = os.getenv("CHESS_USERNAME", "seanr87")
 
 # File paths
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-REPORTS_DIR = os.path.join(BASE_DIR, "reports")
-LOGS_DIR = os.path.join(BASE_DIR, "logs")
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+REPORTS_DIR = BASE_DIR / "reports"
+BOARDS_DIR = REPORTS_DIR / "boards"
+BATCH_DIR = REPORTS_DIR / "batch"
+LOGS_DIR = BASE_DIR / "logs"
+HTTP_CACHE_DIR = DATA_DIR / ".cache"
+GPT_CACHE_DIR = DATA_DIR / ".gpt_cache"
+# Shelf of Stockfish evaluations keyed by position and depth, shared across games
+EVAL_CACHE_PATH = HTTP_CACHE_DIR / "eval_cache"
 
-# Ensure directories exist
-for directory in [DATA_DIR, REPORTS_DIR, LOGS_DIR]:
-    os.makedirs(directory, exist_ok=True)
+# Ensure directories exist (once, at startup)
+for directory in [DATA_DIR, REPORTS_DIR, BOARDS_DIR, BATCH_DIR, LOGS_DIR, HTTP_CACHE_DIR, GPT_CACHE_DIR]:
+    directory.mkdir(parents=True, exist_ok=True)
 
 # Log file paths
-MAIN_LOG = os.path.join(LOGS_DIR, "maignus_bot.log")
-ANALYZER_LOG = os.path.join(LOGS_DIR, "analyzer.log")
-EMAIL_LOG = os.path.join(LOGS_DIR, "email_sender.log")
-FAILURES_LOG = os.path.join(LOGS_DIR, "send_failures.log")
+MAIN_LOG = LOGS_DIR / "maignus_bot.log"
+ANALYZER_LOG = LOGS_DIR / "analyzer.log"
+EMAIL_LOG = LOGS_DIR / "email_sender.log"
+FAILURES_LOG = LOGS_DIR / "send_failures.log"
 
 # Analysis configuration
 STOCKFISH_PATH = os.getenv("STOCKFISH_PATH", "stockfish")
+# Positions are spread over a pool of engines; single-threaded engines keep evals reproducible
+STOCKFISH_WORKERS = int(os.getenv("STOCKFISH_WORKERS", os.cpu_count() or 1))
+STOCKFISH_THREADS_PER_ENGINE = int(os.getenv("STOCKFISH_THREADS_PER_ENGINE", "1"))
+# Hash table size per engine (Stockfish defaults to 16 MB)
+STOCKFISH_HASH_MB = int(os.getenv("STOCKFISH_HASH_MB", "64"))
+STOCKFISH_DEPTH = int(os.getenv("STOCKFISH_DEPTH", "15"))
+# Per-position node caps for the shallow and deep searches, so no single position dominates a game
+STOCKFISH_NODE_BUDGET = int(os.getenv("STOCKFISH_NODE_BUDGET", "200000"))
+STOCKFISH_DEEP_NODE_BUDGET = int(os.getenv("STOCKFISH_DEEP_NODE_BUDGET", "1000000"))
+# Every position is searched at the shallow depth first; opening plies and forced moves stop there
+STOCKFISH_SHALLOW_DEPTH = int(os.getenv("STOCKFISH_SHALLOW_DEPTH", "8"))
+STOCKFISH_SHALLOW_PLIES = int(os.getenv("STOCKFISH_SHALLOW_PLIES", "10"))
+# Other plies are re-searched at STOCKFISH_DEPTH when the shallow eval swings by more than this (cp)
+STOCKFISH_REFINE_THRESHOLD = int(os.getenv("STOCKFISH_REFINE_THRESHOLD", "15"))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4")
+# Game reports: long-form sections use the premium model, one-sentence sections the fast one
+GPT_MODEL_PREMIUM = os.getenv("GPT_MODEL_PREMIUM", "gpt-4o")
+GPT_MODEL_FAST = os.getenv("GPT_MODEL_FAST", "gpt-4o-mini")
+# Upper bound on prompt size; the earliest moves are dropped from the game text to stay under it
+GPT_PROMPT_TOKEN_BUDGET = int(os.getenv("GPT_PROMPT_TOKEN_BUDGET", "8000"))
+# How often to poll a submitted OpenAI batch for completion
+GPT_BATCH_POLL_SECONDS = int(os.getenv("GPT_BATCH_POLL_SECONDS", "60"))
+# Account rate limits; GPT requests are paced to stay under them
+GPT_RPM_LIMIT = int(os.getenv("GPT_RPM_LIMIT", "500"))
+GPT_TPM_LIMIT = int(os.getenv("GPT_TPM_LIMIT", "30000"))
+# Retries (exponential backoff with jitter) for rate-limit, timeout, connection and 5xx errors
+GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "5"))
+# Smaller, faster model for short outputs like email subject lines
+TITLE_GPT_MODEL = os.getenv("TITLE_GPT_MODEL", GPT_MODEL_FAST)
 
 # Email configuration
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
@@ -218,6 +218,17 @@ def create_indexes(conn):
             print(f"✅ Created index '{index_name}' on {table_name}({columns})")
             logger.info(f"Created index {index_name}")
         
+        # Partial indexes: (name, table, columns, predicate)
+        partial_indexes = [
+            # Serves the API's recent-events query: each event's rows in newest-first order
+            ("idx_game_analysis_event_date", "game_analysis", "event_name, date DESC", "event_name IS NOT NULL")
+        ]
+        
+        for index_name, table_name, columns, predicate in partial_indexes:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({columns}) WHERE {predicate}")
+            print(f"✅ Created index '{index_name}' on {table_name}({columns}) WHERE {predicate}")
+            logger.info(f"Created index {index_name}")
+        
         cursor.close()
         
     except psycopg2.Error as e:
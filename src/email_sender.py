@@ -7,7 +7,11 @@ import re
 import markdown
 import os.path
 import json
+import base64
+import functools
+import threading
 import smtplib
+from email import encoders
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
@@ -15,10 +19,12 @@ from board_visualizer import generate_board_image
 from openai import OpenAI
 from config import (
     OPENAI_API_KEY, 
+    TITLE_GPT_MODEL,
     SENDER_EMAIL, 
     EMAIL_APP_PASSWORD, 
     RECEIVER_EMAIL,
     REPORTS_DIR, 
+    BOARDS_DIR,
     EMAIL_LOG, 
     FAILURES_LOG
 )
@@ -27,12 +33,69 @@ from utils import log, get_latest_pgn_path
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-def extract_section(content, heading):
+# Shared Markdown renderer; reset() between documents is much cheaper than rebuilding it
+_markdown = markdown.Markdown()
+_markdown_lock = threading.Lock()
+
+# The PGN footer is a display-only preview; cap it to keep the email payload small
+PGN_FOOTER_MAX_CHARS = 32_768
+
+@functools.lru_cache(maxsize=8)
+def _encoded_image(path, mtime_ns, size):
+    """
+    Read and base64-encode an image once per (path, mtime, size).
+    """
+    with open(path, "rb") as f:
+        return base64.encodebytes(f.read()).decode("ascii")
+
+def build_inline_image(cid, path):
+    """
+    Build an inline MIMEImage for the given Content-ID, reusing the cached encoding.
+    """
+    stat = os.stat(path)
+    encoded = _encoded_image(path, stat.st_mtime_ns, stat.st_size)
+    img = MIMEImage(encoded, "png", _encoder=encoders.encode_noop)
+    img["Content-Transfer-Encoding"] = "base64"
+    img.add_header("Content-ID", f"<{cid}>")
+    img.add_header("Content-Disposition", "inline", filename=cid)
+    return img
+
+def split_sections(content):
+    """
+    Split the analysis report into a {heading: body} dict in a single pass over its "## " headings.
     """
-    Extract a section from the analysis report by heading.
+    sections = {}
+    current = None
+    buf = []
+    for line in content.splitlines():
+        if line.startswith("## "):
+            if current is not None:
+                sections[current] = "\n".join(buf).strip()
+            current = line[3:].strip()
+            buf = []
+        elif current is not None:
+            buf.append(line)
+    if current is not None:
+        sections[current] = "\n".join(buf).strip()
+    return sections
+
+def render_markdown(text):
     """
-    match = re.search(rf"## {heading}\s+(.*?)(?=\s+##|\Z)", content, re.DOTALL)
-    return match.group(1).strip() if match else f"(No {heading} found.)"
+    Render Markdown to HTML using the shared Markdown instance.
+    """
+    with _markdown_lock:
+        _markdown.reset()
+        return _markdown.convert(text)
+
+def extract_section(sections, heading):
+    """
+    Get a section of the split analysis report by heading.
+    """
+    section = sections.get(heading)
+    return section if section is not None else f"(No {heading} found.)"
+
+# Metadata fields shown in the email header; the email is not sent without them
+REQUIRED_METADATA_FIELDS = frozenset({"Date", "Opponent", "Color", "Time Control", "Opening"})
 
 def parse_metadata(metadata_block):
     """
@@ -46,12 +109,23 @@ def parse_metadata(metadata_block):
             meta[key.strip()] = value.strip()
     return meta
 
-def extract_stockfish_stats(content):
+def find_missing_metadata(meta):
+    """
+    Return the required metadata fields that are absent or placeholders.
     """
-    Extract Stockfish statistics from the analysis report.
+    missing = []
+    for field in REQUIRED_METADATA_FIELDS:
+        value = meta.get(field, "N/A")
+        if value in ("N/A", "") or value.startswith("(No "):
+            missing.append(field)
+    return sorted(missing)
+
+def extract_stockfish_stats(sections):
+    """
+    Extract Stockfish statistics from the split analysis report.
     Handles player-specific sections.
     """
-    section = extract_section(content, "Stockfish Evaluation Summary")
+    section = extract_section(sections, "Stockfish Evaluation Summary")
     
     # Find player-specific sections
     white_section_match = re.search(r"Your stats \(white\):(.*?)Opponent stats", section, re.DOTALL)
@@ -276,8 +350,8 @@ def create_critical_moment_visuals():
     Create HTML visualizations for critical moments using the FEN positions and attach images.
     """
     try:
-        critical_path = os.path.join(REPORTS_DIR, "critical_moments.json")
-        if not os.path.exists(critical_path):
+        critical_path = REPORTS_DIR / "critical_moments.json"
+        if not critical_path.exists():
             log("No critical moments data found.", EMAIL_LOG)
             return "", []
 
@@ -300,8 +374,7 @@ def create_critical_moment_visuals():
             analysis_text = moment.get("analysis", "").strip()
 
             img_filename = f"board_{i}.png"
-            img_path = os.path.join(REPORTS_DIR, "boards", img_filename)
-            os.makedirs(os.path.dirname(img_path), exist_ok=True)
+            img_path = BOARDS_DIR / img_filename
             generate_board_image(fen, output_path=img_path)
             attachments.append((img_filename, img_path))
 
@@ -343,12 +416,12 @@ Avoid generic words like "game" or "match"—make it vivid and specific.
 """
     try:
         response = client.chat.completions.create(
-            model="gpt-4",
+            model=TITLE_GPT_MODEL,
             messages=[
                 {"role": "system", "content": "You write clever, catchy email titles."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=30,
+            max_tokens=20,
             temperature=0.8
         )
         return response.choices[0].message.content.strip('" \n')
@@ -360,31 +433,38 @@ def send_analysis_email():
     """
     Format and send the chess analysis email with modular analysis results using smtplib.
     """
-    analysis_path = os.path.join(REPORTS_DIR, "game_analysis.txt")
-    if not os.path.exists(analysis_path):
+    analysis_path = REPORTS_DIR / "game_analysis.txt"
+    if not analysis_path.exists():
         log(f"No analysis file found at {analysis_path}", EMAIL_LOG)
         return False
 
     with open(analysis_path, "r", encoding="utf-8") as f:
         analysis_markdown = f.read()
 
-    game_summary = extract_section(analysis_markdown, "Game Narrative Summary")
-    metadata_block = extract_section(analysis_markdown, "Game Metadata")
-    highlights_lowlights = extract_section(analysis_markdown, "Highlights and Lowlights")
-    coaching_point = extract_section(analysis_markdown, "Coaching Point")
-    stockfish_stats = extract_stockfish_stats(analysis_markdown)
+    sections = split_sections(analysis_markdown)
+    game_summary = extract_section(sections, "Game Narrative Summary")
+    metadata_block = extract_section(sections, "Game Metadata")
+    highlights_lowlights = extract_section(sections, "Highlights and Lowlights")
+    coaching_point = extract_section(sections, "Coaching Point")
+    stockfish_stats = extract_stockfish_stats(sections)
     meta = parse_metadata(metadata_block)
 
+    # An incomplete header is logged but still sent; its fields just show "N/A"
+    missing = find_missing_metadata(meta)
+    if missing:
+        log(f"⚠️ Missing game metadata: {', '.join(missing)}", EMAIL_LOG)
+
     chart_html = create_stockfish_chart(stockfish_stats, meta)
     critical_moments_html, attachments = create_critical_moment_visuals()
 
     # Extract PGN and convert sections
-    pgn_match = re.search(r"## PGN\s+(.*)", analysis_markdown, re.DOTALL)
-    pgn_text = pgn_match.group(1).strip() if pgn_match else "(No PGN found.)"
+    pgn_text = sections.get("PGN") or "(No PGN found.)"
+    if len(pgn_text) > PGN_FOOTER_MAX_CHARS:
+        pgn_text = pgn_text[:PGN_FOOTER_MAX_CHARS] + "…(truncated)"
 
-    summary_html = markdown.markdown(game_summary)
-    highlights_html = markdown.markdown(highlights_lowlights)
-    coaching_html = markdown.markdown(coaching_point)
+    summary_html = render_markdown(game_summary)
+    highlights_html = render_markdown(highlights_lowlights)
+    coaching_html = render_markdown(coaching_point)
     clever_title = generate_clever_title(game_summary)
     subject = f"MAI: {clever_title}"
 
@@ -413,20 +493,16 @@ def send_analysis_email():
         msg["To"] = RECEIVER_EMAIL
 
         alt_part = MIMEMultipart("alternative")
-        alt_part.attach(MIMEText("Chess analysis report attached as HTML.", "plain"))
-        alt_part.attach(MIMEText(html_body, "html"))
+        alt_part.attach(MIMEText("Chess analysis report attached as HTML.", "plain", "utf-8"))
+        alt_part.attach(MIMEText(html_body, "html", "utf-8"))
         msg.attach(alt_part)
 
         for cid, path in attachments:
-            with open(path, "rb") as f:
-                img = MIMEImage(f.read())
-                img.add_header("Content-ID", f"<{cid}>")
-                img.add_header("Content-Disposition", "inline", filename=cid)
-                msg.attach(img)
+            msg.attach(build_inline_image(cid, path))
 
         with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
             server.login(SENDER_EMAIL, EMAIL_APP_PASSWORD)
-            server.sendmail(SENDER_EMAIL, RECEIVER_EMAIL, msg.as_string())
+            server.send_message(msg, SENDER_EMAIL, RECEIVER_EMAIL)
 
         log(f"✅ Email sent with subject: {subject}", EMAIL_LOG)
         return True
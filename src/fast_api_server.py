@@ -3,6 +3,7 @@
 FastAPI server for chess analysis periodic reviews.
 """
 import os
+import asyncio
 import asyncpg
 import uvicorn
 from fastapi import FastAPI, HTTPException
@@ -158,7 +159,8 @@ async def run_review(request: EventRequest):
                 await conn.close()
         
         # Run the periodic review
-        result = run_periodic_review(request.event_name)
+        # The review runs its own event loop for GPT calls, so keep it off the server's loop
+        result = await asyncio.to_thread(run_periodic_review, request.event_name)
         
         logger.info(f"Periodic review completed for event: {request.event_name}")
         return result
@@ -3,7 +3,8 @@
 Fetch the most recent 250 games from Chess.com API for a specified user and insert into database.
 Enhanced with environment variables, better error handling, and logging.
 """
-import requests
+import asyncio
+import httpx
 import json
 import duckdb
 import os
@@ -77,6 +78,9 @@ def validate_username(username):
     logger.info(f"Username validated: {username}")
     return True
 
+# Number of monthly archives requested concurrently per round
+ARCHIVE_BATCH_SIZE = 3
+
 def get_recent_games(username, num_games=250):
     """
     Fetch the most recent games for a Chess.com user.
@@ -88,16 +92,30 @@ def get_recent_games(username, num_games=250):
     Returns:
         list: List of dictionaries containing game data
     """
+    try:
+        return asyncio.run(fetch_recent_games(username, num_games))
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching data from Chess.com API: {e}")
+        return []
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return []
+
+async def fetch_recent_games(username, num_games):
+    """
+    Fetch the archive list, then the monthly archives newest-first in concurrent batches
+    over a single HTTP/2 connection until enough games are collected.
+    """
     base_url = "https://api.chess.com/pub/player"
     headers = {
         "User-Agent": "MAIgnus_CAIrlsen/1.0 (https://github.com/seanr87)"
     }
     
-    try:
+    async with httpx.AsyncClient(http2=True, headers=headers, timeout=30.0) as client:
         logger.info(f"Fetching game archives for user: {username}")
         # Get the player's game archives
         archives_url = f"{base_url}/{username}/games/archives"
-        response = requests.get(archives_url, headers=headers)
+        response = await client.get(archives_url)
         response.raise_for_status()
         
         archives = response.json().get('archives', [])
@@ -111,35 +129,34 @@ def get_recent_games(username, num_games=250):
         games_data = []
         archives.reverse()  # Start with the most recent archives
         
-        for archive_url in archives:
+        for start in range(0, len(archives), ARCHIVE_BATCH_SIZE):
             if len(games_data) >= num_games:
                 break
-                
-            logger.info(f"Fetching games from {archive_url}...")
-            response = requests.get(archive_url, headers=headers)
-            response.raise_for_status()
             
-            monthly_games = response.json().get('games', [])
-            # Reverse to get most recent games first
-            monthly_games.reverse()
+            batch = archives[start:start + ARCHIVE_BATCH_SIZE]
+            for archive_url in batch:
+                logger.info(f"Fetching games from {archive_url}...")
+            responses = await asyncio.gather(*(client.get(archive_url) for archive_url in batch))
             
-            for game in monthly_games:
+            for response in responses:
                 if len(games_data) >= num_games:
                     break
-                    
-                game_data = extract_game_info(game, username)
-                if game_data:
-                    games_data.append(game_data)
+                response.raise_for_status()
+                
+                monthly_games = response.json().get('games', [])
+                # Reverse to get most recent games first
+                monthly_games.reverse()
+                
+                for game in monthly_games:
+                    if len(games_data) >= num_games:
+                        break
+                        
+                    game_data = extract_game_info(game, username)
+                    if game_data:
+                        games_data.append(game_data)
         
         logger.info(f"Successfully retrieved {len(games_data)} games")
         return games_data[:num_games]
-        
-    except requests.RequestException as e:
-        logger.error(f"Error fetching data from Chess.com API: {e}")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return []
 
 def extract_game_info(game_json, username):
     """
@@ -310,11 +327,18 @@ def parse_pgn_details(pgn_text):
             if not event_name or event_name == "?":
                 event_name = None  # Will be stored as NULL in database
             
+            # Count plies by following the main line's nodes, without building a move list
+            total_moves = 0
+            node = game
+            while node.variations:
+                node = node.variations[0]
+                total_moves += 1
+            
             result = {
                 'opening_name': opening_name,
                 'event_name': event_name,  # New field
                 'eco': game.headers.get('ECO', 'Unknown'),
-                'total_moves': len(list(game.mainline_moves())),
+                'total_moves': total_moves,
                 'termination': game.headers.get('Termination', 'Unknown')
             }
             
@@ -340,48 +364,47 @@ def parse_pgn_details(pgn_text):
         'termination': 'Unknown'
     }
 
+# Map common sequences to opening names
+OPENING_SEQUENCES = {
+    ("e4", "c5", "Nf3"): "Sicilian Defense, Open",
+    ("e4", "c5", "f4"): "Grand Prix Attack",
+    ("d4", "d5", "c4"): "Queen's Gambit",
+    ("e4", "e5"): "King's Pawn Opening",
+    ("d4", "Nf6"): "Indian Defense",
+    ("e4", "c6"): "Caro-Kann Defense",
+    ("e4", "e6"): "French Defense",
+    ("Nf3", "Nf6", "c4"): "English Opening",
+    ("d4", "d5"): "Queen's Pawn Game",
+    ("e4", "e5", "Nf3", "Nc6", "Bb5"): "Ruy Lopez",
+    ("e4", "e5", "Nf3", "Nc6", "Bc4"): "Italian Game",
+    ("d4", "Nf6", "c4", "e6"): "Queen's Indian Defense",
+    ("d4", "Nf6", "c4", "g6"): "King's Indian Defense",
+    ("d4", "f5"): "Dutch Defense",
+    ("Nf3", "d5"): "Réti Opening",
+    ("e4", "d6"): "Pirc Defense",
+    ("d4", "d6"): "Modern Defense",
+    ("d4", "c5"): "Benoni Defense",
+}
+OPENING_MAX_PLIES = max(len(sequence) for sequence in OPENING_SEQUENCES)
+
 def infer_opening_from_moves(game):
     """
     Infer the opening name from the first few moves.
     """
+    # SAN is only needed for the opening plies, so stop once we have enough of them
     board = game.board()
     moves = []
-    for move in game.mainline_moves():
+    for i, move in enumerate(game.mainline_moves()):
+        if i >= OPENING_MAX_PLIES:
+            break
         moves.append(board.san(move))
         board.push(move)
-
-    # Map common sequences to opening names
-    openings = {
-        ("e4", "c5", "Nf3"): "Sicilian Defense, Open",
-        ("e4", "c5", "f4"): "Grand Prix Attack",
-        ("d4", "d5", "c4"): "Queen's Gambit",
-        ("e4", "e5"): "King's Pawn Opening",
-        ("d4", "Nf6"): "Indian Defense",
-        ("e4", "c6"): "Caro-Kann Defense",
-        ("e4", "e6"): "French Defense",
-        ("Nf3", "Nf6", "c4"): "English Opening",
-        ("d4", "d5"): "Queen's Pawn Game",
-        ("e4", "e5", "Nf3", "Nc6", "Bb5"): "Ruy Lopez",
-        ("e4", "e5", "Nf3", "Nc6", "Bc4"): "Italian Game",
-        ("d4", "Nf6", "c4", "e6"): "Queen's Indian Defense",
-        ("d4", "Nf6", "c4", "g6"): "King's Indian Defense",
-        ("d4", "f5"): "Dutch Defense",
-        ("Nf3", "d5"): "Réti Opening",
-        ("e4", "d6"): "Pirc Defense",
-        ("d4", "d6"): "Modern Defense",
-        ("d4", "c5"): "Benoni Defense",
-    }
     
-    # Check for exact matches first
-    for sequence, name in openings.items():
-        if moves[:len(sequence)] == list(sequence):
+    # Look up the longest matching prefix first
+    for length in range(len(moves), 0, -1):
+        name = OPENING_SEQUENCES.get(tuple(moves[:length]))
+        if name:
             return name
-    
-    # If no exact match, try shorter sequences
-    if len(moves) >= 2:
-        for sequence, name in openings.items():
-            if len(sequence) <= 2 and moves[:len(sequence)] == list(sequence):
-                return name
             
     return "Unknown Opening"
 
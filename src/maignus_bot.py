@@ -12,10 +12,11 @@ Usage:
 """
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from config import MAIN_LOG
-from utils import log, get_latest_pgn_path, load_pgn_game, extract_player_info, extract_game_metadata
+from utils import log, get_latest_pgn_path, load_pgn_game, read_pgn_text, extract_player_info, extract_game_metadata
 from chess_api import fetch_and_save_pgns
-from modular_analyzer import generate_game_analysis
+from modular_analyzer import generate_game_analysis, get_engine_pool
 from email_sender import send_analysis_email
 
 def main():
@@ -35,10 +36,17 @@ def main():
     
     log("🚀 Starting MAIgnus_CAIrlsen full workflow with modular analysis...", MAIN_LOG)
 
-    # Step 1: Fetch new games from Chess.com
+    # Step 1: Fetch new games from Chess.com. With --force the analysis is certain to run, so the
+    # Stockfish pool starts up in the background meanwhile; a regular run usually finds nothing new
+    # and exits early, so it leaves the pool to start on first use instead of paying for every engine
     log("📥 Checking for new games on Chess.com...", MAIN_LOG)
-    new_games = fetch_and_save_pgns()
-    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        warm_up = executor.submit(get_engine_pool) if force_analysis else None
+        new_games = fetch_and_save_pgns()
+
+    if warm_up is not None and warm_up.exception() is not None:
+        log(f"Stockfish warm-up failed: {warm_up.exception()}", MAIN_LOG)
+
     if not new_games and not force_analysis:
         log("No new games found to analyze. Workflow terminated.", MAIN_LOG)
         return False  # Return early when no new games are found
@@ -52,7 +60,8 @@ def main():
         log("No PGN files found.", MAIN_LOG)
         return False
         
-    game, pgn_text = load_pgn_game(pgn_path)
+    game = load_pgn_game(pgn_path)
+    pgn_text = read_pgn_text(pgn_path)  # embedded verbatim in the report
     player_info = extract_player_info(game)
     metadata_dict = extract_game_metadata(game)
     
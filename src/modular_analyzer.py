@@ -1,104 +1,355 @@
 """
-Refactored chess game analysis module with modular GPT calls.
+Refactored chess game analysis module with structured GPT calls.
 """
 import os
+import asyncio
+import atexit
+import functools
 import chess
 import chess.pgn
 import chess.engine
+import chess.polyglot
 import json
-from openai import OpenAI
+import numpy as np
+import shelve
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI
+
+try:
+    import tiktoken  # Optional: exact prompt token counts
+except ImportError:
+    tiktoken = None
 
 from config import (
     STOCKFISH_PATH, 
+    STOCKFISH_WORKERS,
+    STOCKFISH_THREADS_PER_ENGINE,
+    STOCKFISH_HASH_MB,
+    STOCKFISH_DEPTH,
+    STOCKFISH_NODE_BUDGET,
+    STOCKFISH_DEEP_NODE_BUDGET,
+    STOCKFISH_SHALLOW_DEPTH,
+    STOCKFISH_SHALLOW_PLIES,
+    STOCKFISH_REFINE_THRESHOLD,
     OPENAI_API_KEY, 
-    GPT_MODEL,
+    GPT_MODEL_PREMIUM,
+    GPT_MODEL_FAST,
+    GPT_PROMPT_TOKEN_BUDGET,
+    GPT_BATCH_POLL_SECONDS,
     REPORTS_DIR,
+    BATCH_DIR,
+    EVAL_CACHE_PATH,
     ANALYZER_LOG,
     CHESS_USERNAME
 )
-from utils import log
+from utils import log, run_async, json_bytes, write_bytes, get_mainline_moves, gpt_cache_key, get_cached_gpt_response, cache_gpt_response
+
+# OpenAI client (async so independent sections can be requested concurrently). Its pooled connections
+# belong to the event loop that opened them, and each run_async call starts a new loop, so the client
+# is created per loop and closed when the run that used it ends
+_client = None
+_client_loop = None
+
+def _get_client():
+    """
+    Return the running event loop's OpenAI client, creating it on first use.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        _client_loop = loop
+    return _client
+
+async def with_openai_client(coro):
+    """
+    Await coro, then close the OpenAI client it used before its event loop goes away.
+    """
+    global _client, _client_loop
+    try:
+        return await coro
+    finally:
+        if _client is not None and _client_loop is asyncio.get_running_loop():
+            client, _client, _client_loop = _client, None, None
+            await client.close()
+
+SYSTEM_PROMPT = "You are a professional chess coach."
+
+# Plies of established theory for common ECO codes; book moves are not sent to Stockfish
+ECO_BOOK_DEPTH = {
+    "B01": 6,   # Scandinavian Defense
+    "B10": 6,   # Caro-Kann Defense
+    "B12": 8,   # Caro-Kann, Advance Variation
+    "B20": 4,   # Sicilian Defense
+    "B22": 6,   # Sicilian, Alapin
+    "B33": 12,  # Sicilian, Sveshnikov
+    "B90": 18,  # Sicilian, Najdorf
+    "C00": 4,   # French Defense
+    "C02": 8,   # French, Advance Variation
+    "C20": 4,   # King's Pawn Game
+    "C42": 8,   # Petrov's Defense
+    "C44": 6,   # King's Pawn Game, Scotch/Ponziani
+    "C45": 8,   # Scotch Game
+    "C50": 8,   # Italian Game
+    "C54": 12,  # Italian Game, Giuoco Piano
+    "C60": 6,   # Ruy Lopez
+    "C65": 14,  # Ruy Lopez, Berlin Defense
+    "C78": 12,  # Ruy Lopez, Morphy Defense
+    "D00": 4,   # Queen's Pawn Game
+    "D02": 6,   # London System
+    "D06": 4,   # Queen's Gambit
+    "D30": 8,   # Queen's Gambit Declined
+    "D35": 12,  # Queen's Gambit Declined, Exchange
+    "E60": 6,   # King's Indian Defense
+    "E97": 16,  # King's Indian, Classical
+    "A00": 2,   # Uncommon Opening
+    "A40": 2,   # Queen's Pawn Game
+    "A45": 4,   # Indian Game
+}
+DEFAULT_BOOK_DEPTH = 6
+
+# Centipawn loss above each threshold counts as an inaccuracy, mistake and blunder respectively
+CPL_THRESHOLDS = np.array([20, 75, 300])
+
+def build_completion_body(prompt, max_tokens, model=GPT_MODEL_PREMIUM, temperature=0.7, response_format=None):
+    """
+    Build the chat completion request body, shared by realtime and batch requests.
+    """
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return body
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+def completion_cache_key(prompt, max_tokens, model=GPT_MODEL_PREMIUM, temperature=0.7, response_format=None):
+    """
+    Cache key for a chat completion request.
+    """
+    return gpt_cache_key(model, SYSTEM_PROMPT, prompt, max_tokens, temperature, response_format)
+
+def load_json_response(content):
+    """
+    Parse a JSON-mode response into a dict, or return None if it is cut off or malformed.
+    """
+    try:
+        parsed = json.loads(content or "")
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+async def request_completion(prompt, max_tokens, model=GPT_MODEL_PREMIUM, temperature=0.7, response_format=None):
+    """
+    Request a chat completion, reusing a cached response for an identical request.
+    Only complete responses (and, in JSON mode, valid JSON) are cached, so a bad one is retried next run.
+    """
+    key = completion_cache_key(prompt, max_tokens, model, temperature, response_format)
+    cached = get_cached_gpt_response(key)
+    if cached is not None:
+        log("Using cached GPT response.", ANALYZER_LOG)
+        return cached
+
+    response = await _get_client().chat.completions.create(
+        **build_completion_body(prompt, max_tokens, model, temperature, response_format)
+    )
+
+    choice = response.choices[0]
+    content = choice.message.content or ""
+    if choice.finish_reason == "length":
+        log(f"GPT response hit the {max_tokens} token limit; not caching it.", ANALYZER_LOG)
+    elif response_format and load_json_response(content) is None:
+        log("GPT response was not valid JSON; not caching it.", ANALYZER_LOG)
+    else:
+        cache_gpt_response(key, content)
+    return content
 
-def analyze_with_stockfish(game):
+def open_engine():
+    """
+    Start and configure a Stockfish engine process for the worker pool.
+    """
+    engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
+    options = {"Threads": STOCKFISH_THREADS_PER_ENGINE, "Hash": STOCKFISH_HASH_MB}
+    # Always analyse at full strength, even if the binary was built or configured otherwise
+    if "UCI_LimitStrength" in engine.options:
+        options["UCI_LimitStrength"] = False
+    engine.configure(options)
+    return engine
+
+def open_engines(count=STOCKFISH_WORKERS):
+    """
+    Start a pool of Stockfish engines, one per worker, in parallel.
+    """
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        futures = [executor.submit(open_engine) for _ in range(count)]
+
+    engines = [future.result() for future in futures if future.exception() is None]
+    if len(engines) < count:
+        close_engines(engines)
+        raise next(future.exception() for future in futures if future.exception() is not None)
+    return engines
+
+def close_engines(engines):
+    """
+    Shut down every engine in the pool.
+    """
+    for engine in engines:
+        try:
+            engine.quit()
+        except Exception as e:
+            log(f"Error closing Stockfish engine: {e}", ANALYZER_LOG)
+
+def _evaluate_positions(engine, positions):
+    """
+    Evaluate (zobrist_key, board, limit) positions on one engine, returning White-relative scores.
+    """
+    return [
+        engine.analyse(board, limit, info=chess.engine.INFO_SCORE)["score"].white().score(mate_score=10000)
+        for _, board, limit in positions
+    ]
+
+def eval_cache_key(zobrist_key, limit):
+    """
+    Key a cached evaluation by position (Zobrist hash) and search limits.
+    """
+    return f"{zobrist_key:016x}@{limit.depth}/{limit.nodes}"
+
+def evaluate_positions(engines, positions):
+    """
+    Score (zobrist_key, board, limit) positions, reusing evaluations cached on disk from earlier games
+    and dealing the rest out across the engine pool to evaluate concurrently.
+    """
+    with shelve.open(str(EVAL_CACHE_PATH)) as cache:
+        keys = [eval_cache_key(zobrist_key, limit) for zobrist_key, _, limit in positions]
+        scores = [cache.get(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        log(f"Reusing {len(positions) - len(pending)} of {len(positions)} cached evaluations.", ANALYZER_LOG)
+
+        worker_count = min(len(engines), len(pending))
+        if worker_count:
+            with ThreadPoolExecutor(max_workers=worker_count) as executor:
+                futures = [
+                    executor.submit(_evaluate_positions, engines[i], [positions[p] for p in pending[i::worker_count]])
+                    for i in range(worker_count)
+                ]
+                for i, future in enumerate(futures):
+                    for p, score in zip(pending[i::worker_count], future.result()):
+                        scores[p] = score
+                        if score is not None:
+                            cache[keys[p]] = score
+
+    return scores
+
+@functools.lru_cache(maxsize=None)
+def get_engine_pool():
+    """
+    Return the process-wide engine pool, starting it on first use.
+    Engines stay warm (and keep their hash tables) across games and are shut down at exit.
+    """
+    engines = open_engines()
+    atexit.register(close_engines, engines)
+    return engines
+
+def analyze_with_stockfish(game, engines=None):
     """
     Analyze a chess game with Stockfish engine.
     Tracks errors and critical moments for both players.
     Returns analysis stats and list of critical moments with FEN positions.
+
+    Uses the shared engine pool unless another pool is passed in.
     """
     try:
         log("Starting Stockfish analysis...", ANALYZER_LOG)
-        engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
+        engines = engines or get_engine_pool()
+        # Node budgets cap the time a sharp position can take before reaching the target depth
+        limit = chess.engine.Limit(depth=STOCKFISH_DEPTH, nodes=STOCKFISH_DEEP_NODE_BUDGET)
+        shallow_limit = chess.engine.Limit(depth=STOCKFISH_SHALLOW_DEPTH, nodes=STOCKFISH_NODE_BUDGET)
         board = game.board()
-        
-        white_stats = {"total_cp_loss": 0, "move_count": 0, "blunders": 0, "mistakes": 0, "inaccuracies": 0}
-        black_stats = {"total_cp_loss": 0, "move_count": 0, "blunders": 0, "mistakes": 0, "inaccuracies": 0}
-        critical_moments = []
-        last_eval = None
-        move_num = 0
-
-        for move in game.mainline_moves():
-            pre_move_fen = board.fen()
-            info = engine.analyse(board, chess.engine.Limit(depth=15))
-            current_eval = info["score"].white().score(mate_score=10000)
-
-            current_player = "white" if board.turn == chess.WHITE else "black"
-            stats = white_stats if current_player == "white" else black_stats
-            san_move = board.san(move)
+        book_plies = ECO_BOOK_DEPTH.get(game.headers.get("ECO", ""), DEFAULT_BOOK_DEPTH)
+
+        # Pass 1: walk the game once into per-ply arrays, collecting the distinct positions to evaluate.
+        # Each position is evaluated once: a ply's post-move eval is the next ply's pre-move eval.
+        # Book plies get index -1, which points at a NaN sentinel score (no engine search, no CPL).
+        sans, white_to_move, pre_index, post_index = [], [], [], []
+        position_index = {}  # Zobrist hash -> index into positions, so repeated positions are searched once
+        positions = []
+
+        def index_position(ply_num):
+            position_key = chess.polyglot.zobrist_hash(board)
+            if position_key not in position_index:
+                # Early book plies and forced moves can't swing the eval much; never search them deeply
+                deep = ply_num >= STOCKFISH_SHALLOW_PLIES and board.legal_moves.count() > 1
+                position_index[position_key] = len(positions)
+                positions.append((position_key, board.copy(stack=False), deep))
+            return position_index[position_key]
+
+        for move_num, move in enumerate(get_mainline_moves(game)):
+            in_book = move_num < book_plies
+            sans.append(board.san(move))
+            white_to_move.append(board.turn == chess.WHITE)
+            pre_index.append(-1 if in_book else index_position(move_num))
             board.push(move)
-            move_num += 1
-            stats["move_count"] += 1
-
-            if last_eval is not None and current_eval is not None:
-                if current_player == "white":
-                    cp_loss = max(0, last_eval - current_eval)
-                else:
-                    cp_loss = max(0, current_eval - last_eval)
-
-                stats["total_cp_loss"] += cp_loss
-
-                if cp_loss > 300:
-                    stats["blunders"] += 1
-                elif cp_loss > 75:
-                    stats["mistakes"] += 1
-                elif cp_loss > 20:
-                    stats["inaccuracies"] += 1
-
-                if cp_loss > 10:
-                    critical_moments.append({
-                        "move_num": move_num,
-                        "player": current_player,
-                        "move": san_move,
-                        "cp_loss": cp_loss,
-                        "fen": pre_move_fen,
-                        "pre_eval": last_eval,
-                        "post_eval": current_eval
-                    })
-
-            last_eval = current_eval
-
-        critical_moments.sort(key=lambda x: x["cp_loss"], reverse=True)
-        top_critical_moments = critical_moments[:3]
-        engine.quit()
-
-        white_avg_cpl = round(white_stats["total_cp_loss"] / white_stats["move_count"]) if white_stats["move_count"] else 0
-        black_avg_cpl = round(black_stats["total_cp_loss"] / black_stats["move_count"]) if black_stats["move_count"] else 0
-
-        stockfish_summary = {
-            "white": {
-                "Average CPL": white_avg_cpl,
-                "Blunders": white_stats["blunders"],
-                "Mistakes": white_stats["mistakes"],
-                "Inaccuracies": white_stats["inaccuracies"]
-            },
-            "black": {
-                "Average CPL": black_avg_cpl,
-                "Blunders": black_stats["blunders"],
-                "Mistakes": black_stats["mistakes"],
-                "Inaccuracies": black_stats["inaccuracies"]
+            post_index.append(-1 if in_book else index_position(move_num + 1))
+
+        # Pass 2: evaluate the distinct positions on the engine pool, shallow first
+        scores = evaluate_positions(engines, [(key, position, shallow_limit) for key, position, _ in positions])
+        score_array = np.array([np.nan if score is None else score for score in scores] + [np.nan], dtype=float)
+        pre_positions = np.array(pre_index, dtype=np.intp)
+        post_positions = np.array(post_index, dtype=np.intp)
+
+        # Quiet plies are already settled at shallow depth; only re-search the candidate swings deeply
+        candidates = np.abs(score_array[post_positions] - score_array[pre_positions]) > STOCKFISH_REFINE_THRESHOLD
+        refine = [
+            i for i in np.unique(np.concatenate((pre_positions[candidates], post_positions[candidates])))
+            if i >= 0 and positions[i][2]
+        ]
+        if refine:
+            deep_scores = evaluate_positions(engines, [(positions[i][0], positions[i][1], limit) for i in refine])
+            for i, score in zip(refine, deep_scores):
+                score_array[i] = np.nan if score is None else score
+            log(f"Re-searched {len(refine)} of {len(positions)} positions at depth {STOCKFISH_DEPTH}.", ANALYZER_LOG)
+
+        # Pass 3: classify every ply at once
+        is_white = np.array(white_to_move, dtype=bool)
+        pre_evals = score_array[pre_positions]
+        post_evals = score_array[post_positions]
+        swing = np.where(is_white, pre_evals - post_evals, post_evals - pre_evals)
+        cp_loss = np.where(np.isnan(swing), 0, np.maximum(0, swing))
+
+        # Bucket 0 = fine, 1 = inaccuracy, 2 = mistake, 3 = blunder
+        buckets = np.digitize(cp_loss, CPL_THRESHOLDS, right=True)
+
+        stockfish_summary = {}
+        for color, mask in (("white", is_white), ("black", ~is_white)):
+            move_count = int(mask.sum())
+            counts = np.bincount(buckets[mask], minlength=4)
+            stockfish_summary[color] = {
+                "Average CPL": round(float(cp_loss[mask].sum()) / move_count) if move_count else 0,
+                "Blunders": int(counts[3]),
+                "Mistakes": int(counts[2]),
+                "Inaccuracies": int(counts[1])
             }
-        }
+
+        # Top 3 plies by CPL (ties keep game order); FENs are only built for these
+        candidates = np.flatnonzero(cp_loss > 10)
+        top = candidates[np.argsort(-cp_loss[candidates], kind="stable")][:3]
+        top_critical_moments = [
+            {
+                "move_num": int(i) + 1,
+                "player": "white" if is_white[i] else "black",
+                "move": sans[i],
+                "cp_loss": int(cp_loss[i]),
+                "fen": positions[pre_index[i]][1].fen(),
+                "pre_eval": int(pre_evals[i]),
+                "post_eval": int(post_evals[i])
+            }
+            for i in top
+        ]
 
         log(f"Stockfish analysis complete. Found {len(top_critical_moments)} critical moments.", ANALYZER_LOG)
         return stockfish_summary, top_critical_moments
@@ -141,202 +392,225 @@ Opponent stats ({opponent_color}):
     
     return sf_summary
 
-def get_game_summary(pgn_text, stockfish_summary, player_color, time_control):
+JSON_FORMAT = {"type": "json_object"}
+
+def _compact_pgn(game):
     """
-    Generate a narrative summary of the game using GPT
+    Movetext of the mainline without headers, clock comments or variations.
     """
-    log("Requesting game narrative summary from GPT...", ANALYZER_LOG)
-    
-    prompt = f"""
-You are a chess coach assistant. A game was just played under the following time control: {time_control}.
+    exporter = chess.pgn.StringExporter(headers=False, variations=False, comments=False)
+    return game.accept(exporter)
 
-Please provide a narrative summary of this game (2-3 paragraphs), describing the flow of the game, key phases, and momentum shifts.
+def _windowed_pgn(game, move_num, radius=5):
+    """
+    SAN movetext of the plies within radius of the given (1-based) ply.
+    """
+    moves = get_mainline_moves(game)
+    start = max(0, move_num - 1 - radius)
+    board = game.board()
+    for move in moves[:start]:
+        board.push(move)
+    return board.variation_san(moves[start:move_num + radius])
+
+# Prompt templates for the report requests, filled in per game with str.format_map
+_CONTEXT_TMPL = """
+You are a chess coach assistant. A game was just played under the following time control: {time_control}.
+The player's username is {username} and they played as {player_color}.
 
 Keep in mind that faster time controls like Bullet will naturally have more inaccuracies and blunders. Do not judge harshly for quick mistakes in those formats.
 
-The player's username is {CHESS_USERNAME} and they played as {player_color}.
-
 Stockfish analysis:
 {stockfish_summary}
 
-PGN of the game:
-{pgn_text}
+Moves of the game:
+{movetext}
 """
 
-    response = client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
-            {"role": "system", "content": "You are a professional chess coach."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=500,
-    )
+_NARRATIVE_TMPL = """{context}
+Respond with a single JSON object with exactly these keys:
+- "summary": a narrative summary of the game (2-3 paragraphs), describing the flow of the game, key phases, and momentum shifts.
+- "critical_analyses": a list with one string per critical moment below, in the same order. Each is at most 2 SENTENCES: (1) what made the move problematic and (2) a better alternative.
+
+Critical moments:
+{critical_moments}
+"""
 
-    summary = response.choices[0].message.content
-    log("Game summary generation complete.", ANALYZER_LOG)
-    return summary
+_QUICK_TMPL = """{context}
+Respond with a single JSON object with exactly these keys:
+- "highlights": markdown bullets with ONE SENTENCE EACH: for {username}, one key highlight (best move or strategy) and one key lowlight (worst mistake); then the same for the opponent.
+- "coaching": exactly ONE SENTENCE of actionable coaching advice for {username}, focused on the single most important skill to improve based on this game.
+"""
 
-def get_highlights_lowlights(pgn_text, stockfish_summary, player_color, time_control):
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model):
     """
-    Generate highlights and lowlights for both players using GPT
+    tiktoken encoding for model, or None when tiktoken (or the model's encoding) is unavailable.
     """
-    log("Requesting highlights and lowlights from GPT...", ANALYZER_LOG)
-    
-    prompt = f"""
-You are a chess coach assistant. A game was just played under the following time control: {time_control}.
-
-IMPORTANT: Limit each highlight and lowlight to ONE SENTENCE EACH. Be extremely concise.
-
-For {CHESS_USERNAME} (playing as {player_color}):
-- One key highlight (best move or strategy)
-- One key lowlight (worst mistake)
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
 
-For the opponent:
-- One key highlight (best move or strategy)
-- One key lowlight (worst mistake)
+def count_tokens(text, model):
+    """
+    Count prompt tokens, estimating ~4 characters per token without tiktoken.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
 
-Stockfish analysis:
-{stockfish_summary}
+def _truncate_movetext(game, budget, model):
+    """
+    Mainline movetext with as few of the earliest plies dropped as needed to fit budget tokens.
+    """
+    moves = get_mainline_moves(game)
 
-PGN of the game:
-{pgn_text}
-"""
+    def movetext_from(start):
+        board = game.board()
+        for move in moves[:start]:
+            board.push(move)
+        return "(earlier moves omitted) " + board.variation_san(moves[start:])
+
+    # Binary search for the earliest starting ply that fits
+    low, high = 0, len(moves)
+    while low < high:
+        middle = (low + high) // 2
+        if count_tokens(movetext_from(middle), model) <= budget:
+            high = middle
+        else:
+            low = middle + 1
+    return movetext_from(low)
+
+def build_analysis_requests(game, stockfish_summary, player_color, time_control, critical_moments):
+    """
+    Build the GPT requests for the report, keyed by name: the long-form narrative and
+    critical moment analyses go to the premium model, the one-sentence highlights and
+    coaching point to the fast model. Each value holds request_completion keyword arguments.
+    """
+    moments = [
+        {
+            "move_number": moment["move_num"],
+            "mover": f"{CHESS_USERNAME}'s move" if moment["player"] == player_color.lower() else "Opponent's move",
+            "move": moment["move"],
+            "fen": moment["fen"],
+            "centipawn_loss": moment["cp_loss"],
+            "nearby_moves": _windowed_pgn(game, moment["move_num"]),
+        }
+        for moment in critical_moments
+    ]
+
+    fields = {
+        "time_control": time_control,
+        "username": CHESS_USERNAME,
+        "player_color": player_color,
+        "stockfish_summary": stockfish_summary,
+        "critical_moments": json.dumps(moments, indent=2),
+    }
 
-    response = client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
-            {"role": "system", "content": "You are a professional chess coach."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=500,
-    )
+    def render(movetext):
+        context = _CONTEXT_TMPL.format_map({**fields, "movetext": movetext})
+        return (
+            _NARRATIVE_TMPL.format_map({**fields, "context": context}),
+            _QUICK_TMPL.format_map({**fields, "context": context}),
+        )
+
+    # Keep the (larger) narrative prompt within budget by dropping the earliest moves if needed
+    movetext = _compact_pgn(game)
+    narrative_prompt, quick_prompt = render(movetext)
+    if count_tokens(narrative_prompt, GPT_MODEL_PREMIUM) > GPT_PROMPT_TOKEN_BUDGET:
+        overhead = count_tokens(render("")[0], GPT_MODEL_PREMIUM)
+        movetext = _truncate_movetext(game, GPT_PROMPT_TOKEN_BUDGET - overhead, GPT_MODEL_PREMIUM)
+        narrative_prompt, quick_prompt = render(movetext)
+        log("Trimmed early moves from the GPT prompt to fit the token budget.", ANALYZER_LOG)
 
-    highlights = response.choices[0].message.content
-    log("Highlights and lowlights generation complete.", ANALYZER_LOG)
-    return highlights
+    return {
+        "narrative": {"prompt": narrative_prompt, "max_tokens": 1200, "model": GPT_MODEL_PREMIUM, "response_format": JSON_FORMAT},
+        "quick": {"prompt": quick_prompt, "max_tokens": 300, "model": GPT_MODEL_FAST, "response_format": JSON_FORMAT},
+    }
 
-def get_coaching_point(pgn_text, stockfish_summary, player_color, time_control):
+def parse_narrative(content, critical_moments, player_color):
     """
-    Generate a coaching point for the player using GPT
+    Split the premium model's JSON response into the summary and critical moment analyses.
     """
-    log("Requesting coaching point from GPT...", ANALYZER_LOG)
-    
-    prompt = f"""
-You are a chess coach assistant. A game was just played under the following time control: {time_control}.
+    narrative = load_json_response(content)
+    if narrative is None:
+        log("Could not parse the narrative GPT response.", ANALYZER_LOG)
+        narrative = {"summary": "Error generating analysis: the response was incomplete or not valid JSON."}
 
-IMPORTANT: Provide exactly ONE SENTENCE of actionable coaching advice for {CHESS_USERNAME} (playing as {player_color}).
-Focus on the single most important skill to improve based on this game.
+    texts = narrative.get("critical_analyses") or []
+    critical_analyses = []
+    for i, moment in enumerate(critical_moments):
+        critical_analyses.append({
+            "move_num": moment["move_num"],
+            "player": moment["player"],
+            "move": moment["move"],
+            "cp_loss": moment["cp_loss"],
+            "fen": moment["fen"],
+            "analysis": texts[i] if i < len(texts) else "",
+            "is_player_move": moment["player"] == player_color.lower()
+        })
+
+    return narrative.get("summary", ""), critical_analyses
+
+def parse_quick(content):
+    """
+    Split the fast model's JSON response into the highlights and coaching point.
+    """
+    quick = load_json_response(content)
+    if quick is None:
+        log("Could not parse the highlights GPT response.", ANALYZER_LOG)
+        error = "Error generating analysis: the response was incomplete or not valid JSON."
+        quick = {"highlights": error, "coaching": error}
 
-Stockfish analysis:
-{stockfish_summary}
+    highlights = quick.get("highlights", "")
+    if isinstance(highlights, list):
+        highlights = "\n".join(f"- {item}" for item in highlights)
 
-PGN of the game:
-{pgn_text}
-"""
+    return highlights, quick.get("coaching", "")
 
-    response = client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
-            {"role": "system", "content": "You are a professional chess coach."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=300,
-    )
-
-    coaching = response.choices[0].message.content
-    log("Coaching point generation complete.", ANALYZER_LOG)
-    return coaching
+def parse_full_analysis(contents, critical_moments, player_color):
+    """
+    Split the JSON responses into summary, highlights, coaching point and critical moment analyses.
+    """
+    game_summary, critical_analyses = parse_narrative(contents["narrative"], critical_moments, player_color)
+    highlights, coaching = parse_quick(contents["quick"])
+    return game_summary, highlights, coaching, critical_analyses
 
-def analyze_critical_moment(pgn_text, critical_moment, player_color):
+def build_report_head(game_summary, critical_analyses):
     """
-    Analyze a specific critical moment using GPT
+    Report sections written by the premium model: narrative summary and critical moments.
     """
-    move_num = critical_moment["move_num"]
-    player = critical_moment["player"]
-    move = critical_moment["move"]
-    cp_loss = critical_moment["cp_loss"]
-    fen = critical_moment["fen"]
-    pre_eval = critical_moment["pre_eval"]
-    post_eval = critical_moment["post_eval"]
-    
-    log(f"Analyzing critical moment: Move {move_num}, {player}'s {move} (CP loss: {cp_loss})", ANALYZER_LOG)
-    
-    # Determine if this is the player's move or opponent's
-    is_player_move = (player == player_color.lower())
-    player_text = f"{CHESS_USERNAME}'s move" if is_player_move else "Opponent's move"
-    
-    prompt = f"""
-You are a chess coach assistant analyzing a critical moment in a game.
+    report = f"""
+## Game Narrative Summary
+{game_summary}
 
-IMPORTANT: Limit your analysis to 2 SENTENCES MAXIMUM.
+## Critical Moments
+"""
 
-Critical Moment Details:
-- Move number: {move_num}
-- {player_text}: {move}
-- Position (FEN): {fen}
-- Centipawn loss: {cp_loss}
+    # Add critical moments to the report
+    if critical_analyses:
+        for i, analysis in enumerate(critical_analyses, 1):
+            report += f"""
+### Critical Moment {i}: {analysis['player'].title()}'s Move {analysis['move_num']} ({analysis['move']})
+{analysis['analysis']}
 
-In your 2 sentences: (1) Identify what made this move problematic and (2) Suggest a better alternative.
+*FEN: {analysis['fen']}*
+*CP Loss: {analysis['cp_loss']}*
 
-PGN of the game:
-{pgn_text}
 """
+    else:
+        report += "No critical moments identified in this game.\n"
+    return report
 
-    response = client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
-            {"role": "system", "content": "You are a professional chess coach."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=300,
-    )
-
-    analysis = response.choices[0].message.content
-    log(f"Critical moment analysis complete for move {move_num}.", ANALYZER_LOG)
-    return {
-        "move_num": move_num,
-        "player": player,
-        "move": move,
-        "cp_loss": cp_loss,
-        "fen": fen,
-        "analysis": analysis,
-        "is_player_move": is_player_move
-    }
-
-def generate_game_analysis(game, pgn_text, player_info, metadata_dict):
+def build_report_tail(pgn_text, player_info, metadata_dict, stockfish_stats, highlights_lowlights, coaching_point):
     """
-    Generate a comprehensive game analysis by making modular GPT calls for each section.
+    Remaining report sections: highlights, coaching point, metadata, Stockfish stats and PGN.
     """
-    # Get player's color
     player_color = player_info['color']
-    time_control = metadata_dict.get("TimeControl", "Unknown")
-    
-    # Step 1: Run Stockfish analysis to get stats and critical moments
-    log("Starting comprehensive analysis...", ANALYZER_LOG)
-    stockfish_stats, critical_moments = analyze_with_stockfish(game)
-    
-    # Format Stockfish stats for GPT consumption
-    sf_summary = format_stats_for_gpt(stockfish_stats, player_color)
-    
-    # Step 2: Generate game summary
-    game_summary = get_game_summary(pgn_text, sf_summary, player_color, time_control)
-    
-    # Step 3: Generate highlights and lowlights
-    highlights_lowlights = get_highlights_lowlights(pgn_text, sf_summary, player_color, time_control)
-    
-    # Step 4: Generate coaching point
-    coaching_point = get_coaching_point(pgn_text, sf_summary, player_color, time_control)
-    
-    # Step 5: Analyze critical moments (if any)
-    critical_analyses = []
-    for moment in critical_moments:
-        analysis = analyze_critical_moment(pgn_text, moment, player_color)
-        critical_analyses.append(analysis)
-    
+
     # Format metadata for the report
     meta_summary = "\n".join([f"- {k}: {v}" for k, v in metadata_dict.items()])
     meta_summary += f"\n- Your Name & Rating: {player_info['you']}"
@@ -350,29 +624,7 @@ def generate_game_analysis(game, pgn_text, player_info, metadata_dict):
     sf_player_summary = "\n".join([f"- {k}: {v}" for k, v in player_stats.items()])
     sf_opponent_summary = "\n".join([f"- {k}: {v}" for k, v in opponent_stats.items()])
     
-    # Create the final report
-    final_report = f"""
-## Game Narrative Summary
-{game_summary}
-
-## Critical Moments
-"""
-
-    # Add critical moments to the report
-    if critical_analyses:
-        for i, analysis in enumerate(critical_analyses, 1):
-            final_report += f"""
-### Critical Moment {i}: {analysis['player'].title()}'s Move {analysis['move_num']} ({analysis['move']})
-{analysis['analysis']}
-
-*FEN: {analysis['fen']}*
-*CP Loss: {analysis['cp_loss']}*
-
-"""
-    else:
-        final_report += "No critical moments identified in this game.\n"
-        
-    final_report += f"""
+    return f"""
 ## Highlights and Lowlights
 {highlights_lowlights}
 
@@ -393,25 +645,172 @@ Opponent stats ({opponent_color}):
 {pgn_text.strip()}
 """
 
-    # Save critical moments data in a separate JSON file for potential future use
-    critical_data = {
-        "critical_moments": critical_analyses
-    }
+def build_report(pgn_text, player_info, metadata_dict, stockfish_stats, sections):
+    """
+    Assemble the markdown report from the metadata, Stockfish stats and GPT sections.
+    """
+    game_summary, highlights_lowlights, coaching_point, critical_analyses = sections
+    return build_report_head(game_summary, critical_analyses) + build_report_tail(
+        pgn_text, player_info, metadata_dict, stockfish_stats, highlights_lowlights, coaching_point
+    )
+
+def _append_durably(f, text):
+    """
+    Append text to an open report file and make sure it reaches the disk.
+    """
+    f.write(text)
+    f.flush()
+    os.fsync(f.fileno())
+
+async def write_report_incrementally(report_path, game, pgn_text, player_info, metadata_dict,
+                                     stockfish_stats, sf_summary, critical_moments):
+    """
+    Request the GPT sections concurrently and append each part of the report to a
+    .partial file as soon as it is ready, then move the finished report into place.
+    A failed run leaves whatever was written in the .partial file.
+    Returns the critical moment analyses.
+    """
+    player_color = player_info['color']
+    time_control = metadata_dict.get("TimeControl", "Unknown")
+    requests = build_analysis_requests(game, sf_summary, player_color, time_control, critical_moments)
+    tasks = {name: asyncio.create_task(request_completion(**request)) for name, request in requests.items()}
+    partial_path = report_path.with_name(report_path.name + ".partial")
 
+    try:
+        log("Requesting full game analysis from GPT...", ANALYZER_LOG)
+        with open(partial_path, "w", encoding="utf-8") as f:
+            game_summary, critical_analyses = parse_narrative(await tasks["narrative"], critical_moments, player_color)
+            _append_durably(f, build_report_head(game_summary, critical_analyses))
+
+            highlights, coaching = parse_quick(await tasks["quick"])
+            _append_durably(f, build_report_tail(
+                pgn_text, player_info, metadata_dict, stockfish_stats, highlights, coaching
+            ))
+        log("Full game analysis generation complete.", ANALYZER_LOG)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+    os.replace(partial_path, report_path)
+    return critical_analyses
+
+def generate_game_analysis(game, pgn_text, player_info, metadata_dict, engines=None):
+    """
+    Generate a comprehensive game analysis from Stockfish stats and structured GPT calls.
+    Stockfish runs on the shared engine pool unless another pool is passed in.
+    """
+    # Get player's color
+    player_color = player_info['color']
     
-    os.makedirs(REPORTS_DIR, exist_ok=True)
+    # Step 1: Run Stockfish analysis to get stats and critical moments
+    log("Starting comprehensive analysis...", ANALYZER_LOG)
+    stockfish_stats, critical_moments = analyze_with_stockfish(game, engines)
     
-    # Save the report
-    report_path = os.path.join(REPORTS_DIR, "game_analysis.txt")
-    with open(report_path, "w", encoding="utf-8") as f:
-        f.write(final_report)
+    # Format Stockfish stats for GPT consumption
+    sf_summary = format_stats_for_gpt(stockfish_stats, player_color)
     
-    # Save critical moments data
-    critical_path = os.path.join(REPORTS_DIR, "critical_moments.json")
-    with open(critical_path, "w", encoding="utf-8") as f:
-        json.dump(critical_data, f, indent=2)
+    # Step 2: Generate the GPT sections, writing the report as each one arrives
+    critical_analyses = run_async(with_openai_client(write_report_incrementally(
+        REPORTS_DIR / "game_analysis.txt", game, pgn_text, player_info, metadata_dict,
+        stockfish_stats, sf_summary, critical_moments
+    )))
+
+    # Save critical moments data in a separate JSON file for potential future use
+    critical_data = {
+        "critical_moments": critical_analyses
+    }
+    write_bytes(REPORTS_DIR / "critical_moments.json", json_bytes(critical_data))
     
     log("✅ Complete modular analysis saved to game_analysis.txt", ANALYZER_LOG)
     log(f"✅ Critical moments data saved to critical_moments.json", ANALYZER_LOG)
     
-    return True
\ No newline at end of file
+    return True
+
+async def run_batch(rows):
+    """
+    Upload batch request rows, wait for the batch to finish and return {custom_id: content}.
+    """
+    input_path = BATCH_DIR / "batch_input.jsonl"
+    input_path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+
+    client = _get_client()
+
+    with open(input_path, "rb") as f:
+        batch_file = await client.files.create(file=f, purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    log(f"Submitted batch {batch.id} with {len(rows)} requests.", ANALYZER_LOG)
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(GPT_BATCH_POLL_SECONDS)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        log(f"Batch {batch.id} finished with status {batch.status}.", ANALYZER_LOG)
+        return {}
+
+    output = await client.files.content(batch.output_file_id)
+    results = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        response = row.get("response") or {}
+        if response.get("status_code") == 200:
+            results[row["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        else:
+            log(f"Batch request {row.get('custom_id')} failed: {row.get('error')}", ANALYZER_LOG)
+    return results
+
+def generate_game_analysis_batch(games, engines=None):
+    """
+    Analyze a backlog of games through the OpenAI Batch API (half price, no realtime rate limits).
+    games is a list of (game, pgn_text, player_info, metadata_dict) tuples.
+    Reports are written to the batch reports directory; returns the number written.
+    """
+    engines = engines or get_engine_pool()
+    pending = {}
+    rows = []
+    for i, (game, pgn_text, player_info, metadata_dict) in enumerate(games):
+        player_color = player_info['color']
+        time_control = metadata_dict.get("TimeControl", "Unknown")
+        stockfish_stats, critical_moments = analyze_with_stockfish(game, engines)
+        sf_summary = format_stats_for_gpt(stockfish_stats, player_color)
+        requests = build_analysis_requests(game, sf_summary, player_color, time_control, critical_moments)
+
+        game_id = f"game-{i}"
+        pending[game_id] = (pgn_text, player_info, metadata_dict, stockfish_stats, critical_moments, requests)
+        for name, request in requests.items():
+            rows.append({
+                "custom_id": f"{game_id}-{name}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_completion_body(**request)
+            })
+
+    if not rows:
+        return 0
+
+    results = run_async(with_openai_client(run_batch(rows)))
+
+    written = 0
+    for game_id, (pgn_text, player_info, metadata_dict, stockfish_stats, critical_moments, requests) in pending.items():
+        contents = {name: results.get(f"{game_id}-{name}") for name in requests}
+        if None in contents.values():
+            continue
+
+        # Seed the response cache so a later realtime run of the same game is free
+        for name, request in requests.items():
+            if load_json_response(contents[name]) is not None:
+                cache_gpt_response(completion_cache_key(**request), contents[name])
+
+        sections = parse_full_analysis(contents, critical_moments, player_info['color'])
+        report = build_report(pgn_text, player_info, metadata_dict, stockfish_stats, sections)
+        write_bytes(BATCH_DIR / f"{game_id}_analysis.txt", report.encode("utf-8"))
+        written += 1
+
+    log(f"✅ Batch analysis wrote {written} of {len(pending)} reports.", ANALYZER_LOG)
+    return written
@@ -11,21 +11,135 @@ Created: 2025-05-25
 """
 
 import os
+import json
+import time
+import asyncio
+import threading
+import weakref
+import numpy as np
 import pandas as pd
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from openai import OpenAI
-
-from src.config import OPENAI_API_KEY, GPT_MODEL, REPORTS_DIR, CHESS_USERNAME
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
+
+try:
+    import tiktoken  # Optional: exact prompt token counts
+except ImportError:
+    tiktoken = None
+
+from src.config import (
+    OPENAI_API_KEY, GPT_MODEL_PREMIUM, GPT_PROMPT_TOKEN_BUDGET, GPT_RPM_LIMIT, GPT_TPM_LIMIT, GPT_MAX_RETRIES,
+    REPORTS_DIR, CHESS_USERNAME
+)
 from src.utils import log
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+# OpenAI clients by event loop; the SDK retries 429/5xx/timeouts with jittered exponential backoff.
+# Pooled connections belong to the loop that opened them, and each review runs on its own loop
+# (asyncio.run, often in a worker thread), so every loop gets its own client
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def _get_client() -> AsyncOpenAI:
+    """Return the running event loop's OpenAI client, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None:
+            client = _clients[loop] = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=GPT_MAX_RETRIES)
+    return client
+
+async def _close_client() -> None:
+    """Close the running event loop's OpenAI client, if it has one, before the loop goes away."""
+    with _clients_lock:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+class _RateLimiter:
+    """
+    Token bucket over requests and tokens per minute. Capacity is reserved up front,
+    so callers sleep until their request fits instead of being rejected with a 429.
+    """
+    
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        # Reviews can run on several threads (each with its own event loop), so guard with a thread lock
+        self._lock = threading.Lock()
+    
+    def _reserve(self, tokens: int) -> float:
+        """Take capacity for one request and return how long to wait before sending it."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+            self._requests -= 1
+            self._tokens -= min(tokens, self.tpm)
+            # A negative balance is debt that refills at the per-minute rate
+            return max(0.0, -self._requests * 60 / self.rpm, -self._tokens * 60 / self.tpm)
+    
+    async def wait(self, tokens: int) -> None:
+        delay = self._reserve(tokens)
+        if delay > 0:
+            logger.info(f"Throttling GPT request for {delay:.1f}s to stay under rate limits")
+            await asyncio.sleep(delay)
+
+rate_limiter = _RateLimiter(GPT_RPM_LIMIT, GPT_TPM_LIMIT)
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    """tiktoken encoding for the review model, or None when tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(GPT_MODEL_PREMIUM)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens, estimating ~4 characters per token without tiktoken."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+# Copy-on-write lets the reviewer share the caller's column data instead of deep-copying it
+pd.options.mode.copy_on_write = True
+# Evaluate column arithmetic with numexpr when it is available
+pd.set_option('compute.use_numexpr', True)
+
+# Output budget for the single request that writes all five GPT sections
+REVIEW_MAX_TOKENS = 2000
+
+# Per-game engine stats averaged in the summaries
+STOCKFISH_COLUMNS = ['player_avg_cpl', 'player_blunders', 'player_mistakes', 'player_inaccuracies']
+
+# Columns the review reads; callers loading games just for a review can select only these
+REVIEW_COLUMNS = [
+    'game_id', 'date', 'player_color', 'time_control', 'opening_name', 'result', 'player_rating',
+    'pgn_text', *STOCKFISH_COLUMNS
+]
+
+# GPT-written report sections, in report order: (heading, key in generate_sections())
+REPORT_SECTIONS = (
+    ("Overall Trends", "overall_trends"),
+    ("Opening Repertoire Review", "opening_review"),
+    ("Time Control Breakdown", "time_control"),
+    ("Strengths and Weaknesses", "strengths_weaknesses"),
+    ("Coaching Recommendations", "coaching_recommendations"),
+)
 
 class PeriodicReviewer:
     """
@@ -40,20 +154,43 @@ class PeriodicReviewer:
             games_df (pd.DataFrame): DataFrame containing chess games
             username (str): Player's username
         """
-        self.games_df = games_df.copy() if not games_df.empty else pd.DataFrame()
+        # Shallow copy: with copy-on-write, the columns added below never touch the caller's frame
+        self.games_df = games_df.copy(deep=False) if not games_df.empty else pd.DataFrame()
         self.username = username
         self.stats = {}
+        self._stats_summary_cache: Optional[str] = None
         
         if not self.games_df.empty:
-            # Ensure date column is datetime
-            if 'date' in self.games_df.columns:
-                self.games_df['date'] = pd.to_datetime(self.games_df['date'])
+            # Ensure date column is datetime (parsing only when it isn't already)
+            if 'date' in self.games_df.columns and not pd.api.types.is_datetime64_any_dtype(self.games_df['date']):
+                self.games_df['date'] = pd.to_datetime(self.games_df['date'], format='ISO8601', cache=True, errors='coerce')
+            
+            # Narrow the numeric columns before any stats are computed over them
+            self._downcast_numeric_columns()
+            
+            # Categorize time controls once; several sections group by them
+            if 'time_control' in self.games_df.columns:
+                self._compute_time_categories()
+            
+            # Repeated labels as category codes: groupbys and value_counts hash ints instead of strings
+            for col in ['opening_name', 'result', 'player_color', 'time_control', 'time_category']:
+                if col in self.games_df.columns:
+                    self.games_df[col] = self.games_df[col].astype('category')
             
             # Generate basic statistics
             self._calculate_basic_stats()
         
         logger.info(f"PeriodicReviewer initialized with {len(self.games_df)} games")
     
+    def _downcast_numeric_columns(self) -> None:
+        """Store ratings and error counts as the smallest integer type, and CPL as float32."""
+        # Signed integers so rating differences can't wrap around
+        for col in ['player_rating', 'player_blunders', 'player_mistakes', 'player_inaccuracies']:
+            if col in self.games_df.columns:
+                self.games_df[col] = pd.to_numeric(self.games_df[col], errors='coerce', downcast='integer')
+        if 'player_avg_cpl' in self.games_df.columns:
+            self.games_df['player_avg_cpl'] = pd.to_numeric(self.games_df['player_avg_cpl'], errors='coerce', downcast='float')
+    
     def _calculate_basic_stats(self) -> None:
         """Calculate basic statistics from the games DataFrame."""
         if self.games_df.empty:
@@ -87,79 +224,136 @@ class PeriodicReviewer:
         if len(self.games_df) < 2 or 'player_rating' not in self.games_df.columns:
             return 0
         
-        # Sort by date to get chronological order
-        sorted_games = self.games_df.sort_values('date')
-        first_rating = sorted_games.iloc[0]['player_rating']
-        last_rating = sorted_games.iloc[-1]['player_rating']
+        # Earliest and latest games by date; a linear scan, no full sort needed
+        dates = self.games_df['date']
+        ratings = self.games_df['player_rating']
+        first_rating = ratings.iat[dates.argmin()]
+        last_rating = ratings.iat[dates.argmax()]
         
         return int(last_rating - first_rating)
     
-    def _categorize_time_control(self, time_control: str) -> str:
-        """Categorize time control into standard chess categories."""
-        if not time_control or time_control == 'Unknown':
-            return 'Unknown'
-        
+    async def _chat(self, messages: List[Dict[str, str]], *, max_tokens: int,
+                    temperature: float = 0.7, response_format: Optional[Dict[str, str]] = None) -> Any:
+        """Send one chat completion, paced by the shared rate limiter (retries are handled by the client)."""
+        estimated_tokens = sum(count_tokens(m["content"]) for m in messages) + max_tokens
+        await rate_limiter.wait(estimated_tokens)
+        extra = {"response_format": response_format} if response_format else {}
+        return await _get_client().chat.completions.create(
+            model=GPT_MODEL_PREMIUM,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **extra
+        )
+    
+    async def _request_section(self, system_prompt: str, prompt: str, max_tokens: int,
+                               log_label: str, error_label: str,
+                               response_format: Optional[Dict[str, str]] = None) -> str:
+        """Request report text from GPT, returning an error message instead of raising."""
         try:
-            if '+' in time_control:
-                base_time = int(time_control.split('+')[0])
-            else:
-                base_time = int(time_control)
-            
-            if base_time < 3:
-                return 'Bullet'
-            elif base_time < 10:
-                return 'Blitz'
-            elif base_time < 30:
-                return 'Rapid'
-            else:
-                return 'Classical'
-        except (ValueError, TypeError):
-            return 'Unknown'
+            response = await self._chat(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                response_format=response_format
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"{log_label}: {e}")
+            return f"{error_label}: {str(e)}"
+    
+    def _result_stats(self, key: str) -> pd.DataFrame:
+        """Games, wins, losses, draws and win rate per value of key."""
+        # One crosstab builds the whole key x result pivot; outcomes that never occur become zero columns
+        counts = pd.crosstab(self.games_df[key], self.games_df['result'])
+        stats = counts.reindex(columns=['win', 'loss', 'draw'], fill_value=0)
+        stats.columns = ['wins', 'losses', 'draws']
+        stats.insert(0, 'games', counts.sum(axis=1))
+        # eval fuses the arithmetic (through numexpr when it is installed) instead of allocating temporaries
+        stats.eval('win_rate = wins / games * 100', inplace=True)
+        stats['win_rate'] = stats['win_rate'].round(1)
+        return stats
+    
+    @cached_property
+    def opening_stats(self) -> pd.DataFrame:
+        """Per-opening results, grouped once and shared by every report section."""
+        return self._result_stats('opening_name')
+    
+    @cached_property
+    def time_stats(self) -> pd.DataFrame:
+        """Per-time-category results, grouped once and shared by every report section."""
+        return self._result_stats('time_category')
+    
+    @cached_property
+    def color_stats(self) -> pd.DataFrame:
+        """Per-color results, grouped once and shared by every report section."""
+        return self._result_stats('player_color')
+    
+    @cached_property
+    def _stockfish_means(self) -> pd.Series:
+        """Mean of every engine stat column that is present and has data, in one reduction."""
+        present = [col for col in STOCKFISH_COLUMNS if col in self.games_df.columns]
+        return self.games_df[present].mean(numeric_only=True).dropna()
+    
+    def _compute_time_categories(self) -> None:
+        """Categorize every time control into standard chess categories in one vectorized pass."""
+        base_time = pd.to_numeric(
+            self.games_df['time_control'].astype(str).str.split('+', n=1).str[0],
+            errors='coerce'
+        )
+        # right=False keeps the boundaries as before: < 3 Bullet, < 10 Blitz, < 30 Rapid
+        self.games_df['time_category'] = pd.cut(
+            base_time,
+            bins=[-np.inf, 3, 10, 30, np.inf],
+            labels=['Bullet', 'Blitz', 'Rapid', 'Classical'],
+            right=False
+        ).astype(object).fillna('Unknown')
     
     def _format_stats_for_gpt(self) -> str:
-        """Format statistics in a clean way for GPT consumption."""
+        """Format statistics in a clean way for GPT consumption (computed once per reviewer)."""
+        if self._stats_summary_cache is None:
+            self._stats_summary_cache = self._build_stats_summary()
+        return self._stats_summary_cache
+    
+    def _build_stats_summary(self) -> str:
+        """Build the statistics summary shared by several GPT prompts."""
         if self.games_df.empty:
             return "No games available for analysis."
         
         # Time control analysis
-        time_controls = {}
-        if 'time_control' in self.games_df.columns:
-            self.games_df['time_category'] = self.games_df['time_control'].apply(self._categorize_time_control)
-            time_controls = self.games_df.groupby('time_category')['result'].agg(['count', lambda x: (x == 'win').sum() / len(x) * 100]).round(1)
-            time_controls.columns = ['games', 'win_rate']
+        time_controls = pd.DataFrame()
+        if 'time_category' in self.games_df.columns:
+            time_controls = self.time_stats[['games', 'win_rate']]
         
         # Opening analysis
         opening_stats = ""
         if 'opening_name' in self.games_df.columns:
-            top_openings = self.games_df.groupby('opening_name').agg({
-                'result': ['count', lambda x: (x == 'win').sum() / len(x) * 100 if len(x) > 0 else 0]
-            }).round(1)
-            top_openings.columns = ['games', 'win_rate']
-            top_openings = top_openings.sort_values('games', ascending=False).head(5)
+            top_openings = self.opening_stats[['games', 'win_rate']]
+            top_openings = top_openings.nlargest(5, 'games')
             
-            opening_stats = "\nTop 5 openings:\n"
-            for opening, stats in top_openings.iterrows():
-                opening_stats += f"- {opening}: {int(stats['games'])} games, {stats['win_rate']:.1f}% win rate\n"
+            opening_stats = "\nTop 5 openings:\n" + "".join([
+                f"- {row.Index}: {int(row.games)} games, {row.win_rate:.1f}% win rate\n"
+                for row in top_openings.itertuples()
+            ])
         
         # Stockfish stats (if available)
         stockfish_stats = ""
-        stockfish_cols = ['player_avg_cpl', 'player_blunders', 'player_mistakes', 'player_inaccuracies']
-        if any(col in self.games_df.columns for col in stockfish_cols):
-            stockfish_stats = "\nStockfish Analysis Summary:\n"
-            for col in stockfish_cols:
-                if col in self.games_df.columns:
-                    avg_val = self.games_df[col].mean()
-                    if pd.notna(avg_val):
-                        clean_name = col.replace('player_', '').replace('_', ' ').title()
-                        stockfish_stats += f"- Average {clean_name}: {avg_val:.1f}\n"
+        if any(col in self.games_df.columns for col in STOCKFISH_COLUMNS):
+            stockfish_stats = "\nStockfish Analysis Summary:\n" + "".join([
+                f"- Average {col.replace('player_', '').replace('_', ' ').title()}: {avg_val:.1f}\n"
+                for col, avg_val in self._stockfish_means.items()
+            ])
         
         # Format time control stats
         time_control_stats = ""
         if not time_controls.empty:
-            time_control_stats = "\nTime Control Performance:\n"
-            for category, stats in time_controls.iterrows():
-                if stats['games'] > 0:
-                    time_control_stats += f"- {category}: {int(stats['games'])} games, {stats['win_rate']:.1f}% win rate\n"
+            time_control_stats = "\nTime Control Performance:\n" + "".join([
+                f"- {row.Index}: {int(row.games)} games, {row.win_rate:.1f}% win rate\n"
+                for row in time_controls.itertuples()
+                if row.games > 0
+            ])
         
         return f"""
 Period Analysis Summary:
@@ -172,276 +366,215 @@ Period Analysis Summary:
 {stockfish_stats}
 """.strip()
     
-    def generate_overall_trends(self) -> str:
-        """Generate overall performance trends section using GPT."""
-        logger.info("Generating overall trends analysis...")
-        
-        stats_summary = self._format_stats_for_gpt()
-        
-        prompt = f"""
-You are a tournament-level chess coach reviewing a player's recent games.
-Your job is to assess how they play — not just the results.
-
-Player: {self.username}
-Games: {len(self.games_df)}
-
-{stats_summary}
-
+    def _overall_trends_brief(self) -> str:
+        """Instructions for the overall performance trends section."""
+        return """
 Write 1-2 **insightful, blunt paragraphs** describing the player's strengths, weaknesses, and tendencies.
-Do NOT repeat stats. Focus on:
+Focus on:
 - How the player wins (attacks, endgames, traps?)
 - Strategic tendencies (open positions? risky play?)
 - Decision quality (blunders in good positions? tempo loss?)
 - What worked, and what might stop working against stronger players
-
-Be specific. Pretend you're preparing this player for a serious online tournament.
-"""
-        try:
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a professional chess coach providing performance analysis."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Error generating overall trends: {e}")
-            return f"Error generating analysis: {str(e)}"
+""".strip()
     
-    def generate_opening_review(self) -> str:
-        """Generate opening repertoire review using GPT."""
-        logger.info("Generating opening repertoire review...")
-
-        if self.games_df.empty or 'opening_name' not in self.games_df.columns:
-            return "No opening data available."
-
-        openings_used = self.games_df['opening_name'].value_counts()
-        single_opening = len(openings_used) == 1
-        top_opening = openings_used.idxmax()
-
-        if single_opening:
-            # Break down by variation
-            if 'pgn_text' not in self.games_df.columns:
-                return "PGN data required for opening variation analysis."
-
+    @cached_property
+    def _opening_breakdown(self) -> Tuple[str, pd.DataFrame]:
+        """Heading and per-opening (or per-variation) results, most played first."""
+        if self.games_df['opening_name'].nunique() == 1:
+            # Break down the single opening by variation; parse each distinct PGN once
             from query_names import parse_pgn_details
-            self.games_df['variation'] = self.games_df['pgn_text'].apply(lambda pgn: parse_pgn_details(pgn).get('opening_name', 'Unknown'))
-
-            variation_stats = self.games_df.groupby('variation').agg({
-                'result': ['count', lambda x: (x == 'win').sum(), lambda x: (x == 'loss').sum(), lambda x: (x == 'draw').sum()]
-            })
-            variation_stats.columns = ['games', 'wins', 'losses', 'draws']
-            variation_stats['win_rate'] = (variation_stats['wins'] / variation_stats['games'] * 100).round(1)
-            variation_summary = "\n".join([
-                f"- {variation}: {row['games']} games, {row['win_rate']:.1f}% win rate ({row['wins']}W-{row['losses']}L-{row['draws']}D)"
-                for variation, row in variation_stats.iterrows()
-            ])
-
-            prompt = f"""
-You are a chess coach preparing a player for tournament competition. Your task is to assess how well the player uses openings — not just the results.
-
-Player: {self.username}
-
-{opening_summary}
-
-Analyze the player's use of these openings. For each of the most played:
-- Are they using it correctly? Or making basic structural or tempo mistakes?
-- Do their win rates reflect understanding or poor opposition?
-- Are they entering risky, sharp lines or playing conservatively?
-
-If the player relies heavily on a single opening or variation, assess whether their depth in it is sufficient and suggest how they could be punished by a stronger player. Recommend what to keep, refine, or replace. Avoid generic tips.
-"""
+            variation_names = {
+                pgn: parse_pgn_details(pgn).get('opening_name', 'Unknown')
+                for pgn in self.games_df['pgn_text'].drop_duplicates()
+            }
+            self.games_df['variation'] = self.games_df['pgn_text'].map(variation_names)
+            breakdown = self._result_stats('variation')
+            heading = f"All games used {self.games_df['opening_name'].iat[0]}. Results by variation:"
         else:
-            # Multi-opening mode
-            opening_stats = self.games_df.groupby('opening_name').agg({
-                'result': ['count', lambda x: (x == 'win').sum(), lambda x: (x == 'loss').sum(), lambda x: (x == 'draw').sum()]
-            })
-            opening_stats.columns = ['games', 'wins', 'losses', 'draws']
-            opening_stats['win_rate'] = (opening_stats['wins'] / opening_stats['games'] * 100).round(1)
-            opening_summary = "\n".join([
-                f"- {opening}: {row['games']} games, {row['win_rate']:.1f}% win rate ({row['wins']}W-{row['losses']}L-{row['draws']}D)"
-                for opening, row in opening_stats.sort_values('games', ascending=False).iterrows()
-            ])
-
-            prompt = f"""
-You are a chess coach preparing a player for tournament competition. Your task is to assess how well the player uses openings — not just the results.
-
-Player: {self.username}
+            breakdown = self.opening_stats
+            heading = "Results by opening:"
+        return heading, breakdown.sort_values('games', ascending=False)
+    
+    def _opening_review_brief(self, max_rows: Optional[int] = None) -> str:
+        """
+        Opening results and instructions for the opening repertoire section.
+        max_rows keeps only the most played openings, to fit the prompt's token budget.
+        """
+        heading, breakdown = self._opening_breakdown
+        omitted = len(breakdown) - max_rows if max_rows is not None else 0
+        if omitted > 0:
+            breakdown = breakdown.head(max_rows)
+
+        opening_summary = "\n".join([
+            f"- {row.Index}: {int(row.games)} games, {row.win_rate:.1f}% win rate ({int(row.wins)}W-{int(row.losses)}L-{int(row.draws)}D)"
+            for row in breakdown.itertuples()
+        ])
+        if omitted > 0:
+            opening_summary += f"\n- ({omitted} less-played lines omitted)"
 
+        return f"""
+{heading}
 {opening_summary}
 
-Analyze the player's use of these openings. For each of the most played:
+Assess how well the player uses openings — not just the results. For each of the most played:
 - Are they using it correctly? Or making basic structural or tempo mistakes?
 - Do their win rates reflect understanding or poor opposition?
 - Are they entering risky, sharp lines or playing conservatively?
 
 If the player relies heavily on a single opening or variation, assess whether their depth in it is sufficient and suggest how they could be punished by a stronger player. Recommend what to keep, refine, or replace. Avoid generic tips.
-"""
-
-
-        try:
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a chess coach who specializes in opening preparation."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Error generating opening review: {e}")
-            return f"Error generating opening analysis: {str(e)}"
-
+""".strip()
     
-    def generate_time_control_breakdown(self) -> str:
-        """Generate time control performance breakdown using GPT."""
-        logger.info("Generating time control breakdown...")
-
-        if self.games_df.empty or 'time_control' not in self.games_df.columns:
-            return "No time control data available for analysis."
-
-        # Categorize and count
-        self.games_df['time_category'] = self.games_df['time_control'].apply(self._categorize_time_control)
+    def _time_control_brief(self) -> str:
+        """Per-time-control results and instructions for the time control section."""
+        # Categories were assigned once in __init__
         categories = self.games_df['time_category'].unique()
-        single_category = len(categories) == 1
 
-        # Summary
-        time_stats = self.games_df.groupby('time_category').agg({
-            'result': ['count', lambda x: (x == 'win').sum() / len(x) * 100]
-        }).round(1)
-        time_stats.columns = ['games', 'win_rate']
-
-        time_summary = ""
-        for category, stats in time_stats.iterrows():
-            time_summary += f"- {category}: {int(stats['games'])} games, {stats['win_rate']:.1f}% win rate\n"
+        time_summary = "".join([
+            f"- {row.Index}: {int(row.games)} games, {row.win_rate:.1f}% win rate\n"
+            for row in self.time_stats.itertuples()
+        ])
 
         focus = ""
-        if single_category:
+        if len(categories) == 1:
             focus = f"\nAll games were played as **{categories[0]}**. Please tailor your coaching advice specifically to that format."
 
-        prompt = f"""
-You are a chess coach preparing a player for rated online tournament play. Your task is to assess how well they perform under different time controls.
-
-Player: {self.username}
-
-{time_summary}
-{focus}
+        return f"""
+{time_summary}{focus}
 
-Don't restate stats. Instead:
+Assess how well they perform under different time controls:
 - Evaluate if the player struggles under time pressure (e.g. Blitz) or thrives with time to think (e.g. Rapid)
 - Are they fast and sloppy? Or slow and accurate?
 - Do their openings help save time or cause time trouble?
 - What time controls fit their style? Which need training?
 
 Offer 1 paragraph of concrete, blunt advice. Prioritize how they can train to compete better in faster or slower formats.
-"""
-
-
-        try:
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a chess coach specializing in time control formats."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Error generating time control breakdown: {e}")
-            return f"Error generating time control analysis: {str(e)}"
-
+""".strip()
     
-    def generate_strengths_weaknesses(self) -> str:
-        """Generate strengths and weaknesses analysis using GPT."""
-        logger.info("Generating strengths and weaknesses analysis...")
-        
-        stats_summary = self._format_stats_for_gpt()
-        
-        # Additional analysis for patterns
+    def _strengths_weaknesses_brief(self) -> str:
+        """Color results and instructions for the strengths and weaknesses section."""
         pattern_analysis = ""
-        if not self.games_df.empty:
-            # Color preference
-            if 'player_color' in self.games_df.columns:
-                color_stats = self.games_df.groupby('player_color')['result'].agg(['count', lambda x: (x == 'win').sum() / len(x) * 100]).round(1)
-                color_stats.columns = ['games', 'win_rate']
-                pattern_analysis += "\nColor Performance:\n"
-                for color, stats in color_stats.iterrows():
-                    pattern_analysis += f"- As {color}: {int(stats['games'])} games, {stats['win_rate']:.1f}% win rate\n"
-        
-        prompt = f"""
-You are a chess coach evaluating a player's tendencies across all games.
-
-Player: {self.username}
+        if 'player_color' in self.games_df.columns:
+            pattern_analysis = "Color Performance:\n" + "".join([
+                f"- As {row.Index}: {int(row.games)} games, {row.win_rate:.1f}% win rate\n"
+                for row in self.color_stats.itertuples()
+            ])
 
-{stats_summary}
+        return f"""
 {pattern_analysis}
-
-Avoid repeating statistics. Instead, analyze:
+Evaluate the player's tendencies across all games:
 - Strategic identity (attacker? defender? tactical opportunist?)
 - Patterns in their wins and losses
 - Do they overextend? Blunder in won positions? Survive bad positions?
 - Are they stronger as White or Black — and why?
 
 Summarize strengths, flaws, and trends that would show up to any serious coach or opponent scouting this player. Write 2–3 direct paragraphs with no fluff.
-"""
+""".strip()
+    
+    def _coaching_recommendations_brief(self) -> str:
+        """Instructions for the coaching recommendations section."""
+        return """
+Provide 1–2 direct training recommendations. Tell them what to work on this month:
+- A weakness they can directly fix (e.g. time pressure blunders, poor endgame conversion, overuse of one opening)
+- A study method to address it (e.g. puzzle drills, annotated game review, opening prep via database)
 
+Be concrete, not generic. Prioritize changes that will actually help the player improve their results.
+""".strip()
+    
+    def _section_briefs(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Split the GPT sections into those with enough data to request (name -> brief)
+        and those that can't be written (name -> explanation shown in the report).
+        """
+        briefs = {
+            'overall_trends': self._overall_trends_brief(),
+            'strengths_weaknesses': self._strengths_weaknesses_brief(),
+            'coaching_recommendations': self._coaching_recommendations_brief(),
+        }
+        unavailable = {}
 
-        try:
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are an experienced chess coach skilled at identifying player strengths and weaknesses."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Error generating strengths and weaknesses: {e}")
-            return f"Error generating strengths/weaknesses analysis: {str(e)}"
+        if 'opening_name' not in self.games_df.columns:
+            unavailable['opening_review'] = "No opening data available."
+        elif self.games_df['opening_name'].nunique() == 1 and 'pgn_text' not in self.games_df.columns:
+            unavailable['opening_review'] = "PGN data required for opening variation analysis."
+        else:
+            briefs['opening_review'] = self._opening_review_brief()
+
+        if 'time_category' not in self.games_df.columns:
+            unavailable['time_control'] = "No time control data available for analysis."
+        else:
+            briefs['time_control'] = self._time_control_brief()
+
+        return briefs, unavailable
     
-    def generate_coaching_recommendations(self) -> str:
-        """Generate coaching recommendations using GPT."""
-        logger.info("Generating coaching recommendations...")
-        
-        stats_summary = self._format_stats_for_gpt()
-        
-        prompt = f"""
-You are a tournament chess coach. Based on this player's trends, provide 1–2 direct training recommendations.
+    def _sections_prompt(self, briefs: Dict[str, str]) -> str:
+        """The single prompt that asks for every section in briefs, with the shared stats included once."""
+        section_text = "\n\n".join(f"### {name}\n{brief}" for name, brief in briefs.items())
+        return f"""
+You are a tournament-level chess coach reviewing a player's recent games, preparing them for serious online tournament play.
+Your job is to assess how they play — not just the results. Do NOT restate the statistics.
 
 Player: {self.username}
+Games: {len(self.games_df)}
 
-{stats_summary}
+{self._format_stats_for_gpt()}
 
-Don't repeat results. Tell them what to work on this month:
-- A weakness they can directly fix (e.g. time pressure blunders, poor endgame conversion, overuse of one opening)
-- A study method to address it (e.g. puzzle drills, annotated game review, opening prep via database)
+Write each report section below. Respond with a single JSON object whose keys are exactly the section names ({", ".join(briefs)}) and whose values are the section text.
 
-Be concrete, not generic. Prioritize changes that will actually help the player improve their results.
+{section_text}
 """
+    
+    def _fit_sections_prompt(self, briefs: Dict[str, str]) -> str:
+        """
+        Build the sections prompt, shortening the opening list (the only part that grows with the data)
+        until the prompt fits GPT_PROMPT_TOKEN_BUDGET: first drop lines played fewer than 3 times,
+        then keep halving down to the 5 most played.
+        """
+        prompt = self._sections_prompt(briefs)
+        if 'opening_review' not in briefs or count_tokens(prompt) <= GPT_PROMPT_TOKEN_BUDGET:
+            return prompt
+
+        breakdown = self._opening_breakdown[1]
+        max_rows = max(5, int((breakdown['games'] >= 3).sum()))
+        while True:
+            briefs['opening_review'] = self._opening_review_brief(max_rows=max_rows)
+            prompt = self._sections_prompt(briefs)
+            if max_rows <= 5 or count_tokens(prompt) <= GPT_PROMPT_TOKEN_BUDGET:
+                logger.info(f"Opening list trimmed to {max_rows} of {len(breakdown)} lines to fit the prompt budget")
+                return prompt
+            max_rows = max(5, max_rows // 2)
+    
+    async def generate_sections(self) -> Dict[str, str]:
+        """
+        Generate every GPT-written report section with a single structured request.
+        The shared statistics are sent once and the model answers with one JSON key per section.
+        """
+        logger.info("Generating GPT report sections...")
+
+        briefs, sections = self._section_briefs()
+        prompt = self._fit_sections_prompt(briefs)
+
+        response = await self._request_section(
+            "You are a professional chess coach writing a performance review. You respond only with JSON.",
+            prompt,
+            max_tokens=REVIEW_MAX_TOKENS,
+            log_label="Error generating report sections",
+            error_label="Error generating analysis",
+            response_format={"type": "json_object"}
+        )
 
         try:
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a chess coach providing specific, actionable training recommendations."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=300
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Error generating coaching recommendations: {e}")
-            return f"Error generating coaching recommendations: {str(e)}"
+            fields = json.loads(response)
+        except json.JSONDecodeError:
+            # _request_section returns the error message itself when the request fails
+            fields = {}
+            error_text = response if response.startswith("Error generating") else "Error generating analysis: malformed response"
+        else:
+            error_text = "Error generating analysis: section missing from response"
+
+        for name in briefs:
+            value = fields.get(name)
+            sections[name] = str(value).strip() if value else error_text
+        return sections
     
     def generate_stats_summary(self) -> str:
         """Generate a formatted statistics summary table."""
@@ -451,7 +584,7 @@ Be concrete, not generic. Prioritize changes that will actually help the player
             return "No games available for statistics summary."
         
         # Basic stats
-        summary = f"""
+        overview = f"""
 **Performance Overview:**
 - Total Games: {self.stats['total_games']}
 - Wins: {self.stats['wins']} ({self.stats['win_rate']:.1f}%)
@@ -460,89 +593,95 @@ Be concrete, not generic. Prioritize changes that will actually help the player
 - Average Rating: {self.stats['avg_rating']:.0f}
 - Rating Change: {self.stats['rating_change']:+d}
 """
+        parts = [overview]
         
         # Time control breakdown
-        if 'time_control' in self.games_df.columns:
-            time_stats = self.games_df.groupby('time_category')['result'].agg(['count', lambda x: (x == 'win').sum() / len(x) * 100]).round(1)
-            time_stats.columns = ['games', 'win_rate']
+        if 'time_category' in self.games_df.columns:
+            time_stats = self.time_stats[['games', 'win_rate']]
             
-            summary += "\n**Time Control Breakdown:**\n"
-            for category, stats in time_stats.iterrows():
-                if stats['games'] > 0:
-                    summary += f"- {category}: {int(stats['games'])} games ({stats['win_rate']:.1f}% win rate)\n"
+            parts.append("\n**Time Control Breakdown:**\n")
+            parts.extend([
+                f"- {row.Index}: {int(row.games)} games ({row.win_rate:.1f}% win rate)\n"
+                for row in time_stats.itertuples()
+                if row.games > 0
+            ])
         
         # Stockfish summary
-        stockfish_cols = ['player_avg_cpl', 'player_blunders', 'player_mistakes', 'player_inaccuracies']
-        if any(col in self.games_df.columns for col in stockfish_cols):
-            summary += "\n**Engine Analysis Average:**\n"
-            for col in stockfish_cols:
-                if col in self.games_df.columns:
-                    avg_val = self.games_df[col].mean()
-                    if pd.notna(avg_val):
-                        clean_name = col.replace('player_', '').replace('_', ' ').title()
-                        summary += f"- {clean_name}: {avg_val:.1f}\n"
+        if any(col in self.games_df.columns for col in STOCKFISH_COLUMNS):
+            parts.append("\n**Engine Analysis Average:**\n")
+            parts.extend([
+                f"- {col.replace('player_', '').replace('_', ' ').title()}: {avg_val:.1f}\n"
+                for col, avg_val in self._stockfish_means.items()
+            ])
         
-        return summary.strip()
+        return "".join(parts).strip()
     
     def generate_full_report(self) -> str:
         """Generate the complete performance review report."""
+        return asyncio.run(self._generate_full_report_async())
+    
+    async def _generate_full_report_async(self) -> str:
+        """Generate the complete performance review report as one string."""
+        try:
+            return "".join([chunk async for chunk in self._iter_report_chunks()])
+        finally:
+            await _close_client()
+    
+    async def _iter_report_chunks(self) -> AsyncIterator[str]:
+        """
+        Yield the report piece by piece: the header right away, then each section once it exists,
+        so callers can write it out without holding the whole report.
+        """
         logger.info("Generating full performance review report...")
         
         if self.games_df.empty:
-            return "No games available for analysis. Please ensure the games DataFrame contains data."
+            yield "No games available for analysis. Please ensure the games DataFrame contains data."
+            return
         
         # Get date range for report header
         if 'date' in self.games_df.columns:
-            start_date = self.games_df['date'].min().strftime('%Y-%m-%d')
-            end_date = self.games_df['date'].max().strftime('%Y-%m-%d')
-            date_range = f"Period: {start_date} to {end_date}"
+            start_date, end_date = self.games_df['date'].agg(['min', 'max'])
+            date_range = f"Period: {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}"
         else:
             date_range = "Period: Unknown"
         
-        # Generate each section
-        overall_trends = self.generate_overall_trends()
-        opening_review = self.generate_opening_review()
-        time_control_breakdown = self.generate_time_control_breakdown()
-        strengths_weaknesses = self.generate_strengths_weaknesses()
-        coaching_recommendations = self.generate_coaching_recommendations()
-        stats_summary = self.generate_stats_summary()
-        
-        # Compile full report
-        report = f"""# Chess Performance Review - {self.username}
+        yield f"""# Chess Performance Review - {self.username}
 
 Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 {date_range}
 Games Analyzed: {len(self.games_df)}
 
-## Overall Trends
-
-{overall_trends}
-
-## Opening Repertoire Review
-
-{opening_review}
-
-## Time Control Breakdown
-
-{time_control_breakdown}
-
-## Strengths and Weaknesses
-
-{strengths_weaknesses}
-
-## Coaching Recommendations
-
-{coaching_recommendations}
-
-## Stats Summary
+"""
+        
+        # One GPT request writes every narrative section
+        sections = await self.generate_sections()
+        for title, name in REPORT_SECTIONS:
+            yield f"## {title}\n\n{sections[name]}\n\n"
+        
+        yield f"""## Stats Summary
 
-{stats_summary}
+{self.generate_stats_summary()}
 
 ---
 *Report generated by MAIgnus_CAIrlsen Chess Coaching System*
 """
-        
-        return report
+    
+    async def _write_report(self, file_path: Path) -> None:
+        """
+        Write the report chunk by chunk as it is generated, into a temporary file that replaces
+        file_path only once complete, so readers (e.g. the email sender) never see a partial report.
+        """
+        tmp_path = file_path.with_name(file_path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+                async for chunk in self._iter_report_chunks():
+                    f.write(chunk)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            await _close_client()
     
     def save_report(self, filename: str = "performance_review.txt") -> bool:
         """
@@ -555,15 +694,9 @@ Games Analyzed: {len(self.games_df)}
             bool: True if successful, False otherwise
         """
         try:
-            # Ensure reports directory exists
-            os.makedirs(REPORTS_DIR, exist_ok=True)
-            
-            # Generate and save report
-            report = self.generate_full_report()
-            file_path = os.path.join(REPORTS_DIR, filename)
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(report)
+            # Generate and save report (REPORTS_DIR is created by config at startup)
+            file_path = REPORTS_DIR / filename
+            asyncio.run(self._write_report(file_path))
             
             logger.info(f"Performance review saved to {file_path}")
             print(f"✅ Performance review saved to {file_path}")
@@ -579,8 +712,9 @@ def get_recent_events(db_path, limit=5):
     """Get recent non-null event names from the database."""
     import duckdb
     try:
-        with duckdb.connect(db_path) as conn:
-            result = conn.execute("""
+        # Read-only: no write lock or WAL replay for a listing query
+        with duckdb.connect(db_path, read_only=True) as conn:
+            return conn.execute("""
                 SELECT DISTINCT event_name, MAX(date) as latest_date
                 FROM game_analysis 
                 WHERE event_name IS NOT NULL 
@@ -588,7 +722,6 @@ def get_recent_events(db_path, limit=5):
                 ORDER BY latest_date DESC 
                 LIMIT ?
             """, [limit]).fetchall()
-            return [(event, date) for event, date in result]
     except Exception as e:
         logger.error(f"Error getting recent events: {e}")
         return []
@@ -13,18 +13,22 @@ Created: 2025-05-25
 
 import os
 import re
+import json
+import queue
+import hashlib
+import atexit
+import asyncio
 import smtplib
-import pandas as pd
 from datetime import datetime
+from functools import lru_cache
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-from openai import OpenAI
+from email.mime.application import MIMEApplication
 
 from src.config import (
     OPENAI_API_KEY, 
-    GPT_MODEL,
+    GPT_MODEL_PREMIUM,
+    GPT_MODEL_FAST,
     SENDER_EMAIL, 
     EMAIL_APP_PASSWORD, 
     RECEIVER_EMAIL,
@@ -32,27 +36,167 @@ from src.config import (
     EMAIL_LOG,
     CHESS_USERNAME
 )
-from src.utils import log
+from src.utils import log, gpt_cache_key, get_cached_gpt_response, cache_gpt_response
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+# pandas, numpy and openai are imported where they are first needed, so importing this module stays cheap
+
+# One keep-alive HTTP/2 pool for every GPT request made while sending an email
+OPENAI_MAX_CONNECTIONS = 8
+OPENAI_TIMEOUT_SECONDS = 30.0
+_client = None
+_client_loop = None
+
+def _get_client():
+    """
+    Return the OpenAI client (async, so the requests overlap with SMTP setup), creating it on first use.
+    Pooled connections belong to the event loop that opened them, so each new loop gets a new client.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        import httpx
+        from openai import AsyncOpenAI
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                max_connections=OPENAI_MAX_CONNECTIONS
+            ),
+            timeout=OPENAI_TIMEOUT_SECONDS
+        )
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        _client_loop = loop
+    return _client
+
+# Output budgets: one-sentence game summaries go to the fast model, skill and coaching text to the premium one
+EMAIL_SUMMARIES_MAX_TOKENS = 150
+EMAIL_SECTIONS_MAX_TOKENS = 500
+
+# Key takeaways used when no skill assessment could be generated
+DEFAULT_TAKEAWAYS = "• Continue working on tactical accuracy\n• Focus on endgame improvement\n• Practice time management"
+
+# Hash of the games behind the last email sent; an unchanged set of games is not emailed again
+LAST_EMAIL_HASH_PATH = REPORTS_DIR / ".last_email.hash"
+
+# Moves of the best/worst game sent to GPT; the closing phase is what the one-sentence summaries hinge on
+EMAIL_PGN_MAX_PLIES = 40
+_PGN_HEADER_RE = re.compile(r"^\[.*\]\s*$", re.MULTILINE)
+_PGN_COMMENT_RE = re.compile(r"\{[^}]*\}|\$\d+")
+_PGN_MOVE_NUMBER_RE = re.compile(r"^\d+\.(\.\.)?$")
+
+def _trim_pgn(pgn_text, max_plies=EMAIL_PGN_MAX_PLIES):
+    """
+    Reduce a PGN to its last max_plies moves: headers, comments (clock times), NAGs
+    and black-move numbers are dropped, since they cost prompt tokens without helping the summary.
+    """
+    if not pgn_text:
+        return ''
+    movetext = _PGN_COMMENT_RE.sub(' ', _PGN_HEADER_RE.sub('', pgn_text))
+    
+    kept = []
+    plies = 0
+    truncated = False
+    for token in reversed(movetext.split()):
+        if _PGN_MOVE_NUMBER_RE.match(token):
+            # Keep "12." for white moves; "12..." only appears around comments
+            if not token.endswith('...') and kept:
+                kept.append(token)
+            continue
+        if plies == max_plies:
+            truncated = True
+            break
+        kept.append(token)
+        if token not in ('1-0', '0-1', '1/2-1/2', '*'):
+            plies += 1
+    
+    trimmed = ' '.join(reversed(kept))
+    return f"... {trimmed}" if truncated else trimmed
+
+# Coaching Recommendations section of the performance review report
+_COACHING_RE = re.compile(r"## Coaching Recommendations\s+(.*?)(?=\s+##|\Z)", re.DOTALL)
+
+@lru_cache(maxsize=4)
+def _parse_coaching_section(report_path, mtime):
+    """
+    Read the report and extract its coaching section. Keyed on the modification time,
+    so repeated calls reuse the result until the report is rewritten.
+    """
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report_content = f.read()
+    
+    coaching_match = _COACHING_RE.search(report_content)
+    return coaching_match.group(1).strip() if coaching_match else None
+
+# Logged-in SMTP connections kept open between sends, so later emails skip the TLS handshake and login
+SMTP_POOL_SIZE = 5
+_smtp_pool = queue.LifoQueue(maxsize=SMTP_POOL_SIZE)
+
+def _open_smtp():
+    """Open and authenticate a new SMTP connection."""
+    server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
+    try:
+        server.login(SENDER_EMAIL, EMAIL_APP_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def _close_smtp(server):
+    """Close an SMTP connection, ignoring errors from one that is already dead."""
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+def _acquire_smtp():
+    """Return a pooled connection that still answers NOOP, or a new one."""
+    while True:
+        try:
+            server = _smtp_pool.get_nowait()
+        except queue.Empty:
+            return _open_smtp()
+        try:
+            if server.noop()[0] == 250:
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        _close_smtp(server)
+
+def _release_smtp(server):
+    """Return a connection to the pool, closing it if the pool is full."""
+    try:
+        _smtp_pool.put_nowait(server)
+    except queue.Full:
+        _close_smtp(server)
+
+@atexit.register
+def _close_smtp_pool():
+    while True:
+        try:
+            _close_smtp(_smtp_pool.get_nowait())
+        except queue.Empty:
+            return
 
 class PerformanceEmailGenerator:
     """
     Generates and sends sophisticated periodic performance review emails.
     """
     
-    def __init__(self, games_df=None, username=CHESS_USERNAME):
+    def __init__(self, games_df=None, username=CHESS_USERNAME, stats=None):
         """
         Initialize the performance email generator.
         
         Args:
             games_df (pd.DataFrame, optional): DataFrame containing game data
             username (str): Player's username
+            stats (dict, optional): Aggregates already computed for games_df (see _load_recent_games)
         """
+        import pandas as pd
+        
         self.games_df = games_df.copy() if games_df is not None and not games_df.empty else pd.DataFrame()
         self.username = username
         self.performance_insights = {}
+        self._stats_cache = dict(stats) if stats else {}
         
         log("PerformanceEmailGenerator initialized", EMAIL_LOG)
         
@@ -62,17 +206,32 @@ class PerformanceEmailGenerator:
     
     def _prepare_data(self):
         """Prepare and clean the games DataFrame for analysis."""
+        import pandas as pd
+        
         try:
-            # Ensure date column is datetime
+            # Ensure date column is datetime (parsing only when it isn't already) in ascending order
             if 'date' in self.games_df.columns:
-                self.games_df['date'] = pd.to_datetime(self.games_df['date'])
-                self.games_df = self.games_df.sort_values('date')
+                if not pd.api.types.is_datetime64_any_dtype(self.games_df['date']):
+                    self.games_df['date'] = pd.to_datetime(self.games_df['date'], format='ISO8601', cache=True, errors='coerce')
+                # main() already reads the games oldest-first; other callers may not
+                if not self.games_df['date'].is_monotonic_increasing:
+                    self.games_df = self.games_df.sort_values('date')
             
             # Fill missing values for analysis
             numeric_columns = ['player_avg_cpl', 'player_blunders', 'player_mistakes', 'player_inaccuracies']
             for col in numeric_columns:
                 if col in self.games_df.columns:
-                    self.games_df[col] = pd.to_numeric(self.games_df[col], errors='coerce').fillna(0)
+                    # Smallest dtype that holds the values: float32 for CPL, small integers for error counts
+                    downcast = 'float' if col == 'player_avg_cpl' else 'integer'
+                    self.games_df[col] = pd.to_numeric(
+                        pd.to_numeric(self.games_df[col], errors='coerce').fillna(0),
+                        downcast=downcast
+                    )
+            
+            # Low-cardinality labels as categories: comparisons like result == 'win' work on int codes
+            for col in ['result', 'opening_name', 'opponent_name']:
+                if col in self.games_df.columns:
+                    self.games_df[col] = self.games_df[col].astype('category')
             
             log(f"Data prepared: {len(self.games_df)} games ready for analysis", EMAIL_LOG)
             
@@ -86,6 +245,9 @@ class PerformanceEmailGenerator:
             return
         
         try:
+            # Stats computed in the database are used as-is
+            if not self._stats_cache:
+                self._compute_all_stats()
             self.performance_insights = {
                 'best_game': self._find_best_game(),
                 'worst_game': self._find_worst_game(),
@@ -99,52 +261,90 @@ class PerformanceEmailGenerator:
             log(f"Error generating insights: {e}", EMAIL_LOG)
             self.performance_insights = {}
     
+    def _compute_all_stats(self):
+        """
+        Read the CPL, blunder, result and date columns once and compute every aggregate the insights use:
+        game scores for best/worst, per-third CPL averages, the skill summary stats and the date range.
+        """
+        import numpy as np
+        
+        df = self.games_df
+        n_games = len(df)
+        cpl = df['player_avg_cpl'].to_numpy(dtype=float) if 'player_avg_cpl' in df.columns else None
+        blunders = df['player_blunders'].to_numpy(dtype=float) if 'player_blunders' in df.columns else None
+        if 'result' in df.columns:
+            wins = (df['result'] == 'win').to_numpy()
+            losses = (df['result'] == 'loss').to_numpy()
+        else:
+            wins = losses = None
+        
+        # Best game: low CPL (neutral 50 without CPL data), +20 for no blunders, +10 for a win
+        # Worst game: high CPL, +30 per blunder, +20 for a loss
+        if cpl is not None:
+            score = 100 - np.clip(cpl, 0, 100)
+            penalty = np.clip(cpl, 0, 200)
+        else:
+            score = np.full(n_games, 50.0)
+            penalty = np.zeros(n_games)
+        
+        skill_stats = {}
+        cpl_thirds = None
+        if cpl is not None:
+            skill_stats['avg_cpl'] = cpl.mean()
+            if n_games >= 3:
+                # Views into the one CPL buffer; any remainder goes to the earlier thirds
+                cpl_thirds = tuple(part.mean() for part in np.array_split(cpl, 3))
+        if blunders is not None:
+            score += (blunders == 0) * 20
+            penalty += blunders * 30
+            skill_stats['avg_blunders'] = blunders.mean()
+            skill_stats['blunder_rate'] = (blunders > 0).mean() * 100
+        if wins is not None:
+            score += wins * 10
+            penalty += losses * 20
+            skill_stats['win_rate'] = wins.mean() * 100
+        
+        # First maximum of each, like idxmax
+        best_pos = int(np.nanargmax(score))
+        worst_pos = int(np.nanargmax(penalty))
+        date_bounds = (df['date'].min(), df['date'].max()) if 'date' in df.columns else None
+        self._stats_cache = {
+            'best_pos': best_pos,
+            'best_score': score[best_pos],
+            'worst_pos': worst_pos,
+            'worst_penalty': penalty[worst_pos],
+            'cpl_thirds': cpl_thirds,
+            'skill_stats': skill_stats,
+            'date_bounds': date_bounds
+        }
+    
+    @staticmethod
+    def _stat_displays(game):
+        """Format a game's CPL and blunder count for the email once, with 'N/A' for missing values."""
+        import pandas as pd
+        
+        cpl = game.get('player_avg_cpl')
+        blunders = game.get('player_blunders')
+        return {
+            'cpl_display': f"{cpl:.1f}" if pd.notna(cpl) else 'N/A',
+            'blunders_display': f"{int(blunders)}" if pd.notna(blunders) else 'N/A'
+        }
+    
     def _find_best_game(self):
         """Find the player's best performing game based on accuracy metrics."""
-        if self.games_df.empty:
+        if self.games_df.empty or not self._stats_cache:
             return None
         
         try:
-            # Score games based on multiple criteria
-            scored_games = self.games_df.copy()
-            
-            # Primary scoring: low CPL is better
-            if 'player_avg_cpl' in scored_games.columns:
-                scored_games['cpl_score'] = 100 - scored_games['player_avg_cpl'].clip(0, 100)
-            else:
-                scored_games['cpl_score'] = 50  # Neutral score if no CPL data
-            
-            # Bonus for zero blunders
-            if 'player_blunders' in scored_games.columns:
-                scored_games['blunder_bonus'] = (scored_games['player_blunders'] == 0).astype(int) * 20
-            else:
-                scored_games['blunder_bonus'] = 0
-            
-            # Bonus for wins
-            if 'result' in scored_games.columns:
-                scored_games['result_bonus'] = (scored_games['result'] == 'win').astype(int) * 10
-            else:
-                scored_games['result_bonus'] = 0
-            
-            # Calculate total score
-            scored_games['total_score'] = (
-                scored_games['cpl_score'] + 
-                scored_games['blunder_bonus'] + 
-                scored_games['result_bonus']
-            )
-            
-            # Find best game
-            best_game_idx = scored_games['total_score'].idxmax()
-            best_game = scored_games.loc[best_game_idx]
+            best_game = self.games_df.iloc[self._stats_cache['best_pos']]
             
             return {
                 'opponent': best_game.get('opponent_name', 'Unknown'),
                 'result': best_game.get('result', 'Unknown'),
                 'opening': best_game.get('opening_name', 'Unknown'),
                 'date': best_game.get('date', 'Unknown'),
-                'cpl': best_game.get('player_avg_cpl', 'N/A'),
-                'blunders': best_game.get('player_blunders', 'N/A'),
-                'score': best_game['total_score'],
+                **self._stat_displays(best_game),
+                'score': self._stats_cache['best_score'],
                 'pgn_text': best_game.get('pgn_text', '')
             }
             
@@ -154,51 +354,20 @@ class PerformanceEmailGenerator:
     
     def _find_worst_game(self):
         """Find the player's worst performing game."""
-        if self.games_df.empty:
+        if self.games_df.empty or not self._stats_cache:
             return None
         
         try:
-            # Score games based on negative criteria
-            scored_games = self.games_df.copy()
-            
-            # Primary scoring: high CPL is worse
-            if 'player_avg_cpl' in scored_games.columns:
-                scored_games['cpl_penalty'] = scored_games['player_avg_cpl'].clip(0, 200)
-            else:
-                scored_games['cpl_penalty'] = 0
-            
-            # Penalty for blunders
-            if 'player_blunders' in scored_games.columns:
-                scored_games['blunder_penalty'] = scored_games['player_blunders'] * 30
-            else:
-                scored_games['blunder_penalty'] = 0
-            
-            # Penalty for losses
-            if 'result' in scored_games.columns:
-                scored_games['result_penalty'] = (scored_games['result'] == 'loss').astype(int) * 20
-            else:
-                scored_games['result_penalty'] = 0
-            
-            # Calculate total penalty score
-            scored_games['total_penalty'] = (
-                scored_games['cpl_penalty'] + 
-                scored_games['blunder_penalty'] + 
-                scored_games['result_penalty']
-            )
-            
-            # Find worst game
-            worst_game_idx = scored_games['total_penalty'].idxmax()
-            worst_game = scored_games.loc[worst_game_idx]
+            worst_game = self.games_df.iloc[self._stats_cache['worst_pos']]
             
             return {
                 'opponent': worst_game.get('opponent_name', 'Unknown'),
                 'result': worst_game.get('result', 'Unknown'),
                 'opening': worst_game.get('opening_name', 'Unknown'),
                 'date': worst_game.get('date', 'Unknown'),
-                'cpl': worst_game.get('player_avg_cpl', 'N/A'),
-                'blunders': worst_game.get('player_blunders', 'N/A'),
+                **self._stat_displays(worst_game),
                 'pgn_text': worst_game.get('pgn_text', ''),
-                'penalty_score': worst_game['total_penalty']
+                'penalty_score': self._stats_cache['worst_penalty']
             }
             
         except Exception as e:
@@ -207,47 +376,36 @@ class PerformanceEmailGenerator:
     
     def _analyze_accuracy_trend(self):
         """Analyze accuracy trend by splitting games into thirds."""
-        if self.games_df.empty or len(self.games_df) < 3:
+        if self.games_df.empty or len(self.games_df) < 3 or not self._stats_cache:
             return None
         
         try:
-            # Split games into thirds
-            n_games = len(self.games_df)
-            third = n_games // 3
-            
-            early_games = self.games_df.iloc[:third]
-            mid_games = self.games_df.iloc[third:2*third]
-            late_games = self.games_df.iloc[2*third:]
-            
-            # Calculate average CPL for each period
-            trend_data = {}
-            for period_name, period_games in [('early', early_games), ('mid', mid_games), ('late', late_games)]:
-                if 'player_avg_cpl' in period_games.columns:
-                    avg_cpl = period_games['player_avg_cpl'].mean()
-                    trend_data[period_name] = avg_cpl
-                else:
-                    trend_data[period_name] = None
+            # Average CPL for the early, mid and late thirds of the period
+            cpl_thirds = self._stats_cache['cpl_thirds']
+            if cpl_thirds is None:
+                return {
+                    'early_cpl': None,
+                    'mid_cpl': None,
+                    'late_cpl': None,
+                    'trend_direction': "unknown",
+                    'improvement': 0
+                }
+            early_cpl, mid_cpl, late_cpl = cpl_thirds
             
             # Determine trend direction
-            if all(v is not None for v in trend_data.values()):
-                early_cpl = trend_data['early']
-                late_cpl = trend_data['late']
-                
-                if late_cpl < early_cpl - 5:
-                    trend_direction = "improving"
-                elif late_cpl > early_cpl + 5:
-                    trend_direction = "declining"
-                else:
-                    trend_direction = "stable"
+            if late_cpl < early_cpl - 5:
+                trend_direction = "improving"
+            elif late_cpl > early_cpl + 5:
+                trend_direction = "declining"
             else:
-                trend_direction = "unknown"
+                trend_direction = "stable"
             
             return {
-                'early_cpl': trend_data.get('early'),
-                'mid_cpl': trend_data.get('mid'),
-                'late_cpl': trend_data.get('late'),
+                'early_cpl': early_cpl,
+                'mid_cpl': mid_cpl,
+                'late_cpl': late_cpl,
                 'trend_direction': trend_direction,
-                'improvement': trend_data.get('early', 0) - trend_data.get('late', 0) if all(v is not None for v in [trend_data.get('early'), trend_data.get('late')]) else 0
+                'improvement': early_cpl - late_cpl
             }
             
         except Exception as e:
@@ -255,190 +413,151 @@ class PerformanceEmailGenerator:
             return None
     
     def _generate_skill_summary(self):
-        """Generate skill summary using statistical analysis and GPT."""
-        if self.games_df.empty:
+        """Generate the statistics behind the skill summary."""
+        if self.games_df.empty or not self._stats_cache:
             return None
         
-        try:
-            # Calculate basic stats
-            stats = {}
-            if 'player_avg_cpl' in self.games_df.columns:
-                stats['avg_cpl'] = self.games_df['player_avg_cpl'].mean()
-            if 'player_blunders' in self.games_df.columns:
-                stats['avg_blunders'] = self.games_df['player_blunders'].mean()
-                stats['blunder_rate'] = (self.games_df['player_blunders'] > 0).mean() * 100
-            if 'result' in self.games_df.columns:
-                stats['win_rate'] = (self.games_df['result'] == 'win').mean() * 100
-            
-            # Use GPT to generate insights
-            stats_text = "\n".join([f"- {k}: {v:.1f}" for k, v in stats.items()])
-            
-            prompt = f"""
-Based on these chess performance statistics:
-{stats_text}
-
-Games analyzed: {len(self.games_df)}
-
-Provide a brief skill assessment (2-3 lines max):
-1. Strongest skill or tendency
-2. Most common weakness or mistake pattern
-3. One specific tactical area that needs work
-
-Be direct and actionable, like a tournament coach would be.
-"""
-            
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a chess coach providing concise skill assessments."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=150
-            )
-            
-            skill_text = response.choices[0].message.content.strip()
-            
-            return {
-                'stats': stats,
-                'assessment': skill_text
-            }
-            
-        except Exception as e:
-            log(f"Error generating skill summary: {e}", EMAIL_LOG)
-            return None
+        # The written assessment comes from the batched request in _generate_email_sections
+        return {'stats': self._stats_cache['skill_stats']}
     
     def _get_date_range(self):
         """Get the date range of the analyzed games."""
-        if self.games_df.empty or 'date' not in self.games_df.columns:
+        date_bounds = self._stats_cache.get('date_bounds')
+        if self.games_df.empty or date_bounds is None:
             return "Unknown period"
         
         try:
-            start_date = self.games_df['date'].min().strftime('%Y-%m-%d')
-            end_date = self.games_df['date'].max().strftime('%Y-%m-%d')
+            start_date, end_date = (d.strftime('%Y-%m-%d') for d in date_bounds)
             return f"{start_date} to {end_date}"
         except:
             return "Unknown period"
     
-    def _generate_best_game_summary(self, best_game):
-        """Generate a brief summary of the best game using GPT."""
-        if not best_game:
-            return "No best game identified."
-        
+    def _read_report_coaching_section(self):
+        """Return the Coaching Recommendations section of the saved performance review, or None."""
+        report_path = os.path.join(REPORTS_DIR, "performance_review.txt")
         try:
-            pgn = best_game.get('pgn_text', '')
-
-            prompt = f"""
-            Briefly describe why this was a strong chess performance (1 sentence):
-
-            Result: {best_game['result']} vs {best_game['opponent']}
-            Opening: {best_game['opening']}
-            Accuracy: {best_game['cpl']} average CPL
-            Blunders: {best_game['blunders']}
-
-            PGN of the game:
-            {pgn}
-
-            Focus on what made it a good game (accuracy, clean play, etc.).
-            """
-
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a chess coach commenting on good performances."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=50
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            log(f"Error generating best game summary: {e}", EMAIL_LOG)
-            return "Strong, accurate play."
+            mtime = os.path.getmtime(report_path)
+        except FileNotFoundError:
+            return None
+        return _parse_coaching_section(report_path, mtime)
     
-    def _generate_worst_game_summary(self, worst_game):
-        """Generate a brief summary of the worst game using GPT."""
-        if not worst_game:
-            return "No worst game identified."
+    async def _generate_email_sections(self, best_game, worst_game, skill_summary):
+        """
+        Write every GPT part of the email (best game, worst game, skill assessment, coaching focus);
+        parts the data doesn't support are left out. The two game summaries and the longer sections
+        are separate concurrent JSON requests, so the summaries can use the fast model.
+        """
+        summary_tasks = []
+        tasks = []
+        
+        if best_game:
+            summary_tasks.append(f"""BEST_GAME: Briefly describe why this was a strong chess performance (1 sentence).
+Focus on what made it a good game (accuracy, clean play, etc.).
+Result: {best_game['result']} vs {best_game['opponent']}
+Opening: {best_game['opening']}
+Accuracy: {best_game['cpl_display']} average CPL
+Blunders: {best_game['blunders_display']}
+Final moves:
+{_trim_pgn(best_game.get('pgn_text', ''))}""")
+        
+        if worst_game:
+            summary_tasks.append(f"""WORST_GAME: Briefly explain what went wrong in this chess game (1 sentence).
+Focus on the main issue (time pressure, tactical errors, etc.).
+Result: {worst_game['result']} vs {worst_game['opponent']}
+Opening: {worst_game['opening']}
+Accuracy: {worst_game['cpl_display']} average CPL
+Blunders: {worst_game['blunders_display']}
+Final moves:
+{_trim_pgn(worst_game.get('pgn_text', ''))}""")
+        
+        if skill_summary:
+            stats_text = "\n".join([f"- {k}: {v:.1f}" for k, v in skill_summary['stats'].items()])
+            tasks.append(f"""SKILL: Based on these chess performance statistics, provide a brief skill assessment (2-3 lines max):
+1. Strongest skill or tendency
+2. Most common weakness or mistake pattern
+3. One specific tactical area that needs work
+Be direct and actionable, like a tournament coach would be.
+{stats_text}
+Games analyzed: {len(self.games_df)}""")
         
+        coaching_text = None
         try:
-            pgn = worst_game.get('pgn_text', '')
-
-            prompt = f"""
-            Briefly explain what went wrong in this chess game (1 sentence):
-
-            Result: {worst_game['result']} vs {worst_game['opponent']}
-            Opening: {worst_game['opening']}
-            Accuracy: {worst_game['cpl']} average CPL
-            Blunders: {worst_game['blunders']}
-
-            PGN of the game:
-            {pgn}
-
-            Focus on the main issue (time pressure, tactical errors, etc.).
-            """
-
-            
-            response = client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a chess coach analyzing problematic games."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=50
-            )
-            
-            return response.choices[0].message.content.strip()
-            
+            coaching_text = self._read_report_coaching_section()
         except Exception as e:
-            log(f"Error generating worst game summary: {e}", EMAIL_LOG)
-            return "Accuracy issues and tactical errors."
+            log(f"Error reading coaching recommendations from report: {e}", EMAIL_LOG)
+        if coaching_text:
+            tasks.append(f"""COACHING: Condense this coaching advice into 2 bullet points for an email.
+Make each point actionable and specific (e.g., "Practice tactical puzzles daily" or "Study endgame patterns").
+{coaching_text}""")
+        
+        summaries, sections = await asyncio.gather(
+            self._request_email_sections(summary_tasks, GPT_MODEL_FAST, EMAIL_SUMMARIES_MAX_TOKENS),
+            self._request_email_sections(tasks, GPT_MODEL_PREMIUM, EMAIL_SECTIONS_MAX_TOKENS),
+        )
+        return {**summaries, **sections}
     
-    def _extract_coaching_focus_from_report(self):
-        """Extract coaching recommendations from the performance review report."""
+    async def _request_email_sections(self, tasks, model, max_tokens):
+        """
+        Complete labelled tasks ("LABEL: instructions...") with one request that returns a JSON object,
+        returning the answers keyed by label.
+        """
+        if not tasks:
+            return {}
+        
+        keys = [task.split(":", 1)[0] for task in tasks]
+        prompt = (
+            f"Complete each task below. Respond with a single JSON object with exactly these keys: "
+            f"{', '.join(keys)}. Each value is the plain text answer to that task.\n\n"
+            + "\n\n".join(tasks)
+        )
+        
+        system_prompt = "You are a chess coach writing concise performance review emails. You respond only with JSON."
         try:
-            report_path = os.path.join(REPORTS_DIR, "performance_review.txt")
-            if not os.path.exists(report_path):
-                return self._generate_fallback_coaching_focus()
-            
-            with open(report_path, 'r', encoding='utf-8') as f:
-                report_content = f.read()
-            
-            # Extract coaching recommendations section
-            coaching_match = re.search(r"## Coaching Recommendations\s+(.*?)(?=\s+##|\Z)", report_content, re.DOTALL)
-            
-            if coaching_match:
-                coaching_text = coaching_match.group(1).strip()
-                
-                # Use GPT to condense into email-friendly format
-                prompt = f"""
-Condense this coaching advice into 2 bullet points for an email:
-
-{coaching_text}
-
-Make each point actionable and specific (e.g., "Practice tactical puzzles daily" or "Study endgame patterns").
-"""
-                
-                response = client.chat.completions.create(
-                    model=GPT_MODEL,
+            # Unchanged games produce an identical request, so a re-run reuses the stored response
+            cache_key = gpt_cache_key(model, system_prompt, prompt, max_tokens, "json_object")
+            content = get_cached_gpt_response(cache_key)
+            if content is None:
+                response = await _get_client().chat.completions.create(
+                    model=model,
                     messages=[
-                        {"role": "system", "content": "You are a chess coach creating concise action items."},
+                        {"role": "system", "content": system_prompt},
                         {"role": "user", "content": prompt}
                     ],
+                    response_format={"type": "json_object"},
                     temperature=0.7,
-                    max_tokens=100
+                    max_tokens=max_tokens
                 )
-                
-                return response.choices[0].message.content.strip()
+                content = response.choices[0].message.content
+                fields = json.loads(content)
+                cache_gpt_response(cache_key, content)
             else:
-                return self._generate_fallback_coaching_focus()
-                
+                log(f"Using cached GPT response for email sections ({', '.join(keys)})", EMAIL_LOG)
+                fields = json.loads(content)
         except Exception as e:
-            log(f"Error extracting coaching focus: {e}", EMAIL_LOG)
-            return self._generate_fallback_coaching_focus()
+            log(f"Error generating email sections ({', '.join(keys)}): {e}", EMAIL_LOG)
+            return {}
+        
+        return {key: str(fields[key]).strip() for key in keys if fields.get(key)}
+    
+    def _generate_best_game_summary(self, best_game, sections):
+        """Summary of the best game from the batched email sections."""
+        if not best_game:
+            return "No best game identified."
+        return sections.get('BEST_GAME') or "Strong, accurate play."
+    
+    def _generate_worst_game_summary(self, worst_game, sections):
+        """Summary of the worst game from the batched email sections."""
+        if not worst_game:
+            return "No worst game identified."
+        return sections.get('WORST_GAME') or "Accuracy issues and tactical errors."
+    
+    def _generate_skill_assessment(self, sections):
+        """Skill assessment from the batched email sections."""
+        return sections.get('SKILL') or DEFAULT_TAKEAWAYS
+    
+    def _extract_coaching_focus_from_report(self, sections):
+        """Coaching focus condensed from the performance review report, from the batched email sections."""
+        return sections.get('COACHING') or self._generate_fallback_coaching_focus()
     
     def _generate_fallback_coaching_focus(self):
         """Generate basic coaching recommendations when report is unavailable."""
@@ -449,15 +568,13 @@ Make each point actionable and specific (e.g., "Practice tactical puzzles daily"
             # Basic analysis for fallback recommendations
             recommendations = []
             
-            if 'player_blunders' in self.games_df.columns:
-                avg_blunders = self.games_df['player_blunders'].mean()
-                if avg_blunders > 1:
-                    recommendations.append("• Reduce blunders through slower, more careful calculation")
+            skill_stats = self._stats_cache.get('skill_stats', {})
+            
+            if skill_stats.get('avg_blunders', 0) > 1:
+                recommendations.append("• Reduce blunders through slower, more careful calculation")
             
-            if 'player_avg_cpl' in self.games_df.columns:
-                avg_cpl = self.games_df['player_avg_cpl'].mean()
-                if avg_cpl > 50:
-                    recommendations.append("• Improve position evaluation and candidate move selection")
+            if skill_stats.get('avg_cpl', 0) > 50:
+                recommendations.append("• Improve position evaluation and candidate move selection")
             
             if len(recommendations) < 2:
                 recommendations.append("• Study endgame techniques and tactical patterns")
@@ -486,6 +603,10 @@ Make each point actionable and specific (e.g., "Practice tactical puzzles daily"
             return "Mixed accuracy pattern — continue monitoring performance trends"
     
     def _create_email_content(self):
+        """Create the main email content with performance insights."""
+        return asyncio.run(self._create_email_content_async())
+    
+    async def _create_email_content_async(self):
         """Create the main email content with performance insights."""
         try:
             # Get insights
@@ -495,15 +616,19 @@ Make each point actionable and specific (e.g., "Practice tactical puzzles daily"
             skill_summary = self.performance_insights.get('skill_summary')
             date_range = self.performance_insights.get('date_range', 'Unknown period')
             
+            # One GPT request writes the game summaries, skill assessment and coaching focus
+            sections = await self._generate_email_sections(best_game, worst_game, skill_summary)
+            
             # Generate game summaries
-            best_summary = self._generate_best_game_summary(best_game) if best_game else "No standout game this period."
-            worst_summary = self._generate_worst_game_summary(worst_game) if worst_game else "No problematic games identified."
+            best_summary = self._generate_best_game_summary(best_game, sections) if best_game else "No standout game this period."
+            worst_summary = self._generate_worst_game_summary(worst_game, sections) if worst_game else "No problematic games identified."
+            takeaways = self._generate_skill_assessment(sections)
             
             # Format trend comment
             trend_comment = self._format_trend_comment(trend_data)
             
             # Get coaching recommendations
-            coaching_focus = self._extract_coaching_focus_from_report()
+            coaching_focus = self._extract_coaching_focus_from_report(sections)
             
             # Create email body
             email_body = f"""Hi {self.username},
@@ -517,7 +642,7 @@ Here's your chess performance summary for {date_range}.
 📊 Accuracy Trend: {trend_comment}
 
 Key takeaways:
-{skill_summary['assessment'] if skill_summary else '• Continue working on tactical accuracy\n• Focus on endgame improvement\n• Practice time management'}
+{takeaways}
 
 💡 Coaching Focus:
 {coaching_focus}
@@ -545,6 +670,47 @@ Continue practicing and stay focused on improvement!
 
 MAIgnus Chess Coach"""
     
+    def _load_report_attachment(self):
+        """Return the performance review as an encoded attachment part, or None if unavailable."""
+        report_path = os.path.join(REPORTS_DIR, "performance_review.txt")
+        if not os.path.exists(report_path):
+            return None
+        try:
+            # MIMEApplication base64-encodes the bytes once as it builds the part
+            with open(report_path, "rb") as attachment:
+                part = MIMEApplication(attachment.read(), Name="performance_review.txt")
+            part['Content-Disposition'] = 'attachment; filename="performance_review.txt"'
+            log("Performance review attached to email", EMAIL_LOG)
+            return part
+        except Exception as e:
+            log(f"Could not attach performance review: {e}", EMAIL_LOG)
+            return None
+    
+    def _games_hash(self):
+        """Hash the prepared games DataFrame, row by row, into a short hex digest."""
+        import pandas as pd
+        
+        row_hashes = pd.util.hash_pandas_object(self.games_df, index=False).to_numpy()
+        return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+    
+    async def _prepare_email(self):
+        """Generate the email content, connect to SMTP and load the attachment concurrently."""
+        content_task = asyncio.ensure_future(self._create_email_content_async())
+        try:
+            server, attachment = await asyncio.gather(
+                asyncio.to_thread(_acquire_smtp),
+                asyncio.to_thread(self._load_report_attachment),
+            )
+        except BaseException:
+            content_task.cancel()
+            raise
+        try:
+            email_content = await content_task
+        except BaseException:
+            _release_smtp(server)
+            raise
+        return email_content, server, attachment
+    
     def send_performance_email(self):
         """
         Send the performance review email with insights and attachments.
@@ -555,47 +721,57 @@ MAIgnus Chess Coach"""
         try:
             log("Starting performance email generation and sending", EMAIL_LOG)
             
-            # Create email content
-            email_content = self._create_email_content()
-            
-            # Generate subject line
-            games_count = len(self.games_df) if not self.games_df.empty else 0
-            date_range = self.performance_insights.get('date_range', 'Recent Period')
-            subject = f"MAIgnus Performance Review: {games_count} Games Analyzed ({date_range})"
-            
-            # Create email message
-            msg = MIMEMultipart()
-            msg["Subject"] = subject
-            msg["From"] = SENDER_EMAIL
-            msg["To"] = RECEIVER_EMAIL
+            # Skip GPT and SMTP entirely when there is nothing new to review
+            if self.games_df.empty:
+                log("No games to review; skipping performance email", EMAIL_LOG)
+                return True
+            current_hash = self._games_hash()
+            try:
+                if LAST_EMAIL_HASH_PATH.read_text(encoding="utf-8").strip() == current_hash:
+                    log("No change since last review; skipping performance email", EMAIL_LOG)
+                    return True
+            except FileNotFoundError:
+                pass
             
-            # Add email body
-            msg.attach(MIMEText(email_content, "plain"))
+            # Write the content while the SMTP connection and the attachment are prepared in threads
+            email_content, server, attachment = asyncio.run(self._prepare_email())
             
-            # Attach performance review file if it exists
-            report_path = os.path.join(REPORTS_DIR, "performance_review.txt")
-            if os.path.exists(report_path):
+            try:
+                # Generate subject line
+                games_count = len(self.games_df) if not self.games_df.empty else 0
+                date_range = self.performance_insights.get('date_range', 'Recent Period')
+                subject = f"MAIgnus Performance Review: {games_count} Games Analyzed ({date_range})"
+                
+                # Create email message
+                msg = MIMEMultipart()
+                msg["Subject"] = subject
+                msg["From"] = SENDER_EMAIL
+                msg["To"] = RECEIVER_EMAIL
+                
+                # Add email body
+                msg.attach(MIMEText(email_content, "plain", "utf-8"))
+                
+                # Attach performance review file if it exists
+                if attachment is not None:
+                    msg.attach(attachment)
+                
+                # Send email, reconnecting once if the server dropped the connection since its health check
                 try:
-                    with open(report_path, "rb") as attachment:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(attachment.read())
-                    
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        'attachment; filename= "performance_review.txt"'
-                    )
-                    msg.attach(part)
-                    log("Performance review attached to email", EMAIL_LOG)
-                except Exception as e:
-                    log(f"Could not attach performance review: {e}", EMAIL_LOG)
-            
-            # Send email
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(SENDER_EMAIL, EMAIL_APP_PASSWORD)
-                server.sendmail(SENDER_EMAIL, RECEIVER_EMAIL, msg.as_string())
+                    server.send_message(msg, SENDER_EMAIL, RECEIVER_EMAIL)
+                except smtplib.SMTPServerDisconnected:
+                    _close_smtp(server)
+                    server = None
+                    server = _open_smtp()
+                    server.send_message(msg, SENDER_EMAIL, RECEIVER_EMAIL)
+            finally:
+                if server is not None:
+                    _release_smtp(server)
             
             log(f"✅ Performance email sent successfully with subject: {subject}", EMAIL_LOG)
+            
+            tmp_path = LAST_EMAIL_HASH_PATH.with_suffix(".tmp")
+            tmp_path.write_text(current_hash, encoding="utf-8")
+            os.replace(tmp_path, LAST_EMAIL_HASH_PATH)
             return True
             
         except Exception as e:
@@ -603,13 +779,14 @@ MAIgnus Chess Coach"""
             return False
 
 
-def send_performance_review_email(games_df=None, username=CHESS_USERNAME):
+def send_performance_review_email(games_df=None, username=CHESS_USERNAME, stats=None):
     """
     Main function to send a performance review email.
     
     Args:
         games_df (pd.DataFrame, optional): DataFrame with game data
         username (str): Player's username
+        stats (dict, optional): Aggregates already computed for games_df
         
     Returns:
         bool: True if successful, False otherwise
@@ -618,7 +795,7 @@ def send_performance_review_email(games_df=None, username=CHESS_USERNAME):
         log("Initiating performance review email process", EMAIL_LOG)
         
         # Create email generator
-        email_generator = PerformanceEmailGenerator(games_df, username)
+        email_generator = PerformanceEmailGenerator(games_df, username, stats)
         
         # Send the email
         success = email_generator.send_performance_email()
@@ -635,6 +812,77 @@ def send_performance_review_email(games_df=None, username=CHESS_USERNAME):
         return False
 
 
+# Latest games, newest first; game_id breaks date ties so every query sees the same rows in the same order
+RECENT_GAMES_SQL = """
+    SELECT * FROM game_analysis
+    ORDER BY date DESC, game_id DESC
+    LIMIT ?
+"""
+
+# Same aggregates as PerformanceEmailGenerator._compute_all_stats, with positions in oldest-first order
+RECENT_STATS_SQL = f"""
+    WITH recent AS (
+        SELECT
+            row_number() OVER (ORDER BY date ASC, game_id ASC) - 1 AS pos,
+            ntile(3) OVER (ORDER BY date ASC, game_id ASC) AS third,
+            date,
+            COALESCE(player_avg_cpl, 0)::DOUBLE AS cpl,
+            COALESCE(player_blunders, 0)::DOUBLE AS blunders,
+            (result = 'win') IS TRUE AS won,
+            (result = 'loss') IS TRUE AS lost
+        FROM ({RECENT_GAMES_SQL})
+    ), scored AS (
+        SELECT *,
+            100 - LEAST(GREATEST(cpl, 0), 100) + (blunders = 0)::INT * 20 + won::INT * 10 AS score,
+            LEAST(GREATEST(cpl, 0), 200) + blunders * 30 + lost::INT * 20 AS penalty
+        FROM recent
+    )
+    SELECT
+        count(*),
+        first(pos ORDER BY score DESC, pos ASC), max(score),
+        first(pos ORDER BY penalty DESC, pos ASC), max(penalty),
+        avg(cpl) FILTER (WHERE third = 1),
+        avg(cpl) FILTER (WHERE third = 2),
+        avg(cpl) FILTER (WHERE third = 3),
+        avg(cpl), avg(blunders), avg((blunders > 0)::INT) * 100, avg(won::INT) * 100,
+        min(date), max(date)
+    FROM scored
+"""
+
+def _load_recent_games(conn, limit=50):
+    """
+    Load the latest games oldest-first, with the email's aggregates computed by DuckDB.
+    
+    Returns:
+        tuple: (games DataFrame, stats dict for PerformanceEmailGenerator, or None without games)
+    """
+    games_df = conn.execute(
+        f"SELECT * FROM ({RECENT_GAMES_SQL}) ORDER BY date ASC, game_id ASC", [limit]
+    ).df()
+    if games_df.empty:
+        return games_df, None
+    
+    (n_games, best_pos, best_score, worst_pos, worst_penalty,
+     first_third, middle_third, last_third,
+     avg_cpl, avg_blunders, blunder_rate, win_rate,
+     first_date, last_date) = conn.execute(RECENT_STATS_SQL, [limit]).fetchone()
+    stats = {
+        'best_pos': int(best_pos),
+        'best_score': best_score,
+        'worst_pos': int(worst_pos),
+        'worst_penalty': worst_penalty,
+        'cpl_thirds': (first_third, middle_third, last_third) if n_games >= 3 else None,
+        'skill_stats': {
+            'avg_cpl': avg_cpl,
+            'avg_blunders': avg_blunders,
+            'blunder_rate': blunder_rate,
+            'win_rate': win_rate
+        },
+        'date_bounds': (first_date, last_date)
+    }
+    return games_df, stats
+
+
 def main():
     """
     Main execution function for testing/standalone usage.
@@ -655,22 +903,19 @@ def main():
     try:
         # Load game data if database is available
         games_df = None
+        stats = None
         if os.path.exists(args.db):
             try:
                 import duckdb
                 with duckdb.connect(args.db) as conn:
-                    games_df = conn.execute("""
-                        SELECT * FROM game_analysis 
-                        ORDER BY date DESC 
-                        LIMIT 50
-                    """).df()
+                    games_df, stats = _load_recent_games(conn)
                 log(f"Loaded {len(games_df)} games from database", EMAIL_LOG)
             except Exception as e:
                 log(f"Could not load games from database: {e}", EMAIL_LOG)
         
         if args.test:
             # Test mode: create generator and show content
-            generator = PerformanceEmailGenerator(games_df)
+            generator = PerformanceEmailGenerator(games_df, stats=stats)
             content = generator._create_email_content()
             print("Email Content Preview:")
             print("="*60)
@@ -679,7 +924,7 @@ def main():
             return True
         else:
             # Send actual email
-            return send_performance_review_email(games_df)
+            return send_performance_review_email(games_df, stats=stats)
             
     except Exception as e:
         log(f"Error in main execution: {e}", EMAIL_LOG)
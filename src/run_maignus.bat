@@ -19,9 +19,6 @@ if "%1"=="--force" set FORCE_PARAM=--force
 :: Log start time and parameters
 echo ===== MAIgnus_CAIrlsen Started at %date% %time% with parameters: [%FORCE_PARAM%] ===== > "%logfile%"
 
-:: Path to Python - using your specific Python path
-python "%~dp0\maignus_bot.py" %FORCE_PARAM% >> "%logfile%" 2>&1
-
 :: Run the script and log output
 echo Running MAIgnus_CAIrlsen chess analysis bot... >> "%logfile%"
 python maignus_bot.py %FORCE_PARAM% >> "%logfile%" 2>&1
@@ -3,16 +3,29 @@
 FastAPI server for chess analysis periodic reviews.
 """
 import os
+import re
+import asyncio
+import time
+import uuid
 import asyncpg
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Dict
 import logging
 from dotenv import load_dotenv
+
+try:
+    import orjson  # Optional: ORJSONResponse needs it installed
+except ImportError:
+    orjson = None
+
 import sys
 import os
-from src.periodic_reviewer import PeriodicReviewer
+from src.periodic_reviewer import PeriodicReviewer, REVIEW_COLUMNS
 from src.analysis import ChessAnalyzer
 
 
@@ -24,8 +37,6 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Chess Analysis API", version="1.0.0")
-
 # Database connection string from environment
 DB_URL = os.getenv("DB_URL")
 if not DB_URL:
@@ -33,6 +44,67 @@ if not DB_URL:
 
 logger.info(f"Database URL loaded: {DB_URL[:20]}..." if len(DB_URL) > 20 else "Database URL loaded")
 
+# Connections are opened once and shared by all requests, instead of a handshake per request
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 20
+DB_COMMAND_TIMEOUT = 30
+DB_STATEMENT_CACHE_SIZE = 100
+
+# Hot queries, kept as constants: asyncpg prepares each once per pooled connection and reuses
+# the statement from its cache (statement_cache_size) on later requests
+
+# DISTINCT ON takes each event's newest row straight off idx_game_analysis_event_date (event_name, date DESC),
+# so no hash aggregate or sort over every game is needed before picking the latest five events
+RECENT_EVENTS_SQL = """
+    WITH latest AS (
+        SELECT DISTINCT ON (event_name) event_name, date AS latest_date
+        FROM game_analysis 
+        WHERE event_name IS NOT NULL 
+        ORDER BY event_name, date DESC
+    )
+    SELECT event_name, latest_date
+    FROM latest 
+    ORDER BY latest_date DESC 
+    LIMIT 5
+"""
+
+# EXISTS stops at the first matching row (an idx_game_analysis_event_name probe) instead of counting them all
+EVENT_EXISTS_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM game_analysis 
+        WHERE event_name = $1
+    )
+"""
+
+# The recent-events aggregate is served from memory for this long before being re-queried
+EVENTS_CACHE_TTL_SECONDS = 60
+_events_cache = {"events": None, "expires": 0.0}
+_events_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the PostgreSQL connection pool at startup and close it at shutdown."""
+    app.state.pool = await asyncpg.create_pool(
+        dsn=DB_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE
+    )
+    logger.info("Database connection pool created")
+    try:
+        yield
+    finally:
+        await app.state.pool.close()
+
+# Responses are serialized with orjson when it is installed
+app = FastAPI(
+    title="Chess Analysis API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
+
 class EventRequest(BaseModel):
     event_name: str
 
@@ -40,13 +112,45 @@ class EventResponse(BaseModel):
     event_name: str
     latest_date: str
 
-async def get_db_connection():
-    """Get PostgreSQL database connection using asyncpg."""
+# Review jobs by task id (state: queued, running or finished), most recent last; old jobs are dropped
+REVIEW_JOBS_MAX = 100
+review_jobs: "OrderedDict[str, Dict]" = OrderedDict()
+
+def _record_review_job(task_id: str, **fields) -> None:
+    """Create or update a review job's record, keeping only the latest REVIEW_JOBS_MAX jobs."""
+    review_jobs.setdefault(task_id, {"task_id": task_id}).update(fields)
+    while len(review_jobs) > REVIEW_JOBS_MAX:
+        review_jobs.popitem(last=False)
+
+# Clients connected to /ws/tasks; each finished review job is pushed to all of them
+task_listeners: "set[WebSocket]" = set()
+
+async def _notify_task_listeners(job: Dict) -> None:
+    """Send a finished job's record to every connected listener, dropping any that have gone away."""
+    for websocket in list(task_listeners):
+        try:
+            await websocket.send_json(job)
+        except Exception as e:
+            logger.warning(f"Dropping task listener: {e}")
+            task_listeners.discard(websocket)
+
+async def run_review_job(task_id: str, event_name: str) -> None:
+    """Run a queued periodic review after the response has been sent, recording its result."""
+    _record_review_job(task_id, state="running")
+    # The review runs its own event loop for GPT calls, so keep it off the server's loop
     try:
-        return await asyncpg.connect(os.getenv("DB_URL"))
+        result = await asyncio.to_thread(run_periodic_review, event_name)
     except Exception as e:
-        logger.error(f"Database connection failed: {e}")
-        raise HTTPException(status_code=500, detail="Database connection failed")
+        logger.error(f"Error running queued review: {e}")
+        result = {"status": "error", "message": f"Analysis failed: {str(e)}", "event_name": event_name}
+    _record_review_job(task_id, state="finished", result=result)
+    logger.info(f"Periodic review completed for event: {event_name}")
+    await _notify_task_listeners(
+        {"task_id": task_id, "state": "finished", "event_name": event_name, "result": result}
+    )
+
+# Characters dropped from event names when building report filenames (anything but letters, digits, space, - and _)
+UNSAFE_FILENAME_CHARS_RE = re.compile(r"[^\w\- ]")
 
 def run_periodic_review(event_name: str) -> Dict[str, str]:
     """
@@ -68,9 +172,10 @@ def run_periodic_review(event_name: str) -> Dict[str, str]:
         
         # Initialize analyzer and load data for the specific event
         analyzer = ChessAnalyzer(db_path)
-        analyzer.load_data(event_name=event_name)
+        analyzer.load_data(event_name=event_name, columns=REVIEW_COLUMNS)
+        games_count = len(analyzer.games_df)
         
-        if analyzer.games_df.empty:
+        if games_count == 0:
             return {
                 "status": "error",
                 "message": f"No games found for event: {event_name}",
@@ -81,16 +186,16 @@ def run_periodic_review(event_name: str) -> Dict[str, str]:
         reviewer = PeriodicReviewer(analyzer.games_df)
         
         # Save report with event-specific filename
-        safe_event_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '' for c in event_name)
+        safe_event_name = UNSAFE_FILENAME_CHARS_RE.sub('', event_name)
         filename = f"performance_review_{safe_event_name.replace(' ', '_')}.txt"
         success = reviewer.save_report(filename)
         
         if success:
             return {
                 "status": "success",
-                "message": f"Performance review generated for {len(analyzer.games_df)} games",
+                "message": f"Performance review generated for {games_count} games",
                 "event_name": event_name,
-                "games_analyzed": len(analyzer.games_df),
+                "games_analyzed": games_count,
                 "report_filename": filename
             }
         else:
@@ -111,28 +216,23 @@ def run_periodic_review(event_name: str) -> Dict[str, str]:
 @app.get("/events", response_model=List[EventResponse])
 async def get_recent_events():
     """Get the 5 most recent event names and dates."""
-    conn = None
     try:
-        conn = await get_db_connection()
-        
-        query = """
-            SELECT DISTINCT event_name, MAX(date) as latest_date
-            FROM game_analysis 
-            WHERE event_name IS NOT NULL 
-            GROUP BY event_name 
-            ORDER BY latest_date DESC 
-            LIMIT 5
-        """
-        
-        rows = await conn.fetch(query)
-        
-        events = [
-            EventResponse(
-                event_name=row['event_name'],
-                latest_date=row['latest_date'].isoformat() if row['latest_date'] else ""
-            )
-            for row in rows
-        ]
+        async with _events_lock:
+            if _events_cache["events"] is not None and time.monotonic() < _events_cache["expires"]:
+                return _events_cache["events"]
+            
+            rows = await app.state.pool.fetch(RECENT_EVENTS_SQL)
+            
+            events = [
+                EventResponse(
+                    event_name=row['event_name'],
+                    latest_date=row['latest_date'].isoformat() if row['latest_date'] else ""
+                )
+                for row in rows
+            ]
+            
+            _events_cache["events"] = events
+            _events_cache["expires"] = time.monotonic() + EVENTS_CACHE_TTL_SECONDS
         
         logger.info(f"Retrieved {len(events)} recent events")
         return events
@@ -140,44 +240,30 @@ async def get_recent_events():
     except Exception as e:
         logger.error(f"Error fetching events: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch events")
-    finally:
-        if conn:
-            await conn.close()
 
-@app.post("/run-review")
-async def run_review(request: EventRequest):
-    """Run periodic review for the specified event."""
+@app.post("/run-review", status_code=202)
+async def run_review(request: EventRequest, background_tasks: BackgroundTasks):
+    """Queue a periodic review for the specified event; the result is pushed over /ws/tasks and kept at /review-status/{task_id}."""
     try:
         if not request.event_name.strip():
             raise HTTPException(status_code=400, detail="Event name cannot be empty")
         
         # Verify event exists in database
-        conn = None
-        try:
-            conn = await get_db_connection()
-            
-            exists_query = """
-                SELECT COUNT(*) FROM game_analysis 
-                WHERE event_name = $1
-            """
-            
-            count = await conn.fetchval(exists_query, request.event_name)
-            
-            if count == 0:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Event '{request.event_name}' not found in database"
-                )
-                
-        finally:
-            if conn:
-                await conn.close()
+        exists = await app.state.pool.fetchval(EVENT_EXISTS_SQL, request.event_name)
+        
+        if not exists:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Event '{request.event_name}' not found in database"
+            )
         
-        # Run the periodic review
-        result = run_periodic_review(request.event_name)
+        # Run the periodic review once the response has been sent
+        task_id = uuid.uuid4().hex
+        _record_review_job(task_id, state="queued", event_name=request.event_name, result=None)
+        background_tasks.add_task(run_review_job, task_id, request.event_name)
         
-        logger.info(f"Periodic review completed for event: {request.event_name}")
-        return result
+        logger.info(f"Periodic review queued for event: {request.event_name} (task {task_id})")
+        return {"status": "queued", "task_id": task_id, "event_name": request.event_name}
         
     except HTTPException:
         raise
@@ -185,15 +271,44 @@ async def run_review(request: EventRequest):
         logger.error(f"Error running review: {e}")
         raise HTTPException(status_code=500, detail="Failed to run periodic review")
 
+@app.get("/review-status/{task_id}")
+async def review_status(task_id: str):
+    """Get the state of a queued review, and its result once finished."""
+    job = review_jobs.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Review task '{task_id}' not found")
+    return job
+
+@app.websocket("/ws/tasks")
+async def task_updates(websocket: WebSocket):
+    """Push each review job's record to the client when it finishes, so clients needn't poll /review-status."""
+    await websocket.accept()
+    task_listeners.add(websocket)
+    try:
+        # Nothing is expected from the client; reading just notices when it disconnects
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        task_listeners.discard(websocket)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "service": "chess-analysis-api"}
 
 if __name__ == "__main__":
+    # Review jobs, task listeners and the events cache live in process memory, so /review-status and
+    # /ws/tasks only work across several workers once that state is shared; WEB_CONCURRENCY therefore
+    # defaults to one worker
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
     uvicorn.run(
-        app, 
+        "src.server:app" if workers > 1 else app, 
         host="0.0.0.0", 
         port=8000,
+        workers=workers,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
         log_level="info"
     )
\ No newline at end of file
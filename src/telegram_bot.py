@@ -5,12 +5,21 @@ Uses python-telegram-bot v20+ with async handlers.
 """
 import os
 import json
+import time
+import asyncio
+import hashlib
 import logging
 import aiohttp
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, TimedOut
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 
+try:
+    import orjson  # Optional: much faster JSON parsing and serialization
+except ImportError:
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
@@ -30,6 +39,192 @@ if not TELEGRAM_TOKEN:
 API_BASE_URL = "https://maignus-cairlsen.onrender.com"
 EVENTS_ENDPOINT = f"{API_BASE_URL}/events"
 REVIEW_ENDPOINT = f"{API_BASE_URL}/run-review"
+REVIEW_STATUS_ENDPOINT = f"{API_BASE_URL}/review-status"
+TASK_UPDATES_WS_URL = f"{API_BASE_URL.replace('http', 'ws', 1)}/ws/tasks"
+
+# Reviews run in the background on the server. Finished reviews are pushed over the task updates
+# WebSocket; their status is still polled, rarely while the socket is up, in case a push is missed
+REVIEW_POLL_SECONDS = 10
+REVIEW_FALLBACK_POLL_SECONDS = 60
+REVIEW_POLL_TIMEOUT_SECONDS = 15 * 60
+
+# Progress messages ("Fetching...", "Starting...") are only sent when a call takes longer than this
+PROGRESS_MESSAGE_DELAY_SECONDS = 0.8
+
+class TelegramThrottler:
+    """
+    Paces outgoing sends and edits to Telegram's limits (about one message per second per chat,
+    30 per second overall). A RetryAfter is waited out for the advised time and a timeout is
+    retried with exponential backoff; a message still failing after max_attempts is dropped.
+    """
+    
+    def __init__(self, per_chat_interval=1.05, global_per_second=30, max_attempts=5):
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / global_per_second
+        self.max_attempts = max_attempts
+        self.chat_next: dict[int, float] = {}
+        self.global_next = 0.0
+        self.lock = asyncio.Lock()
+    
+    async def _wait_turn(self, chat_id):
+        """Sleep until chat_id's next free slot, then until the next free global slot."""
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            now = loop.time()
+            start = max(now, self.chat_next.get(chat_id, 0.0))
+            self.chat_next[chat_id] = start + self.per_chat_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+        
+        # Global slots are taken only once a chat's own turn has come, so busy chats don't delay others
+        async with self.lock:
+            now = loop.time()
+            start = max(now, self.global_next)
+            self.global_next = start + self.global_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+    
+    async def send(self, chat_id, make_call):
+        """Run make_call() (a send or edit) in chat_id's turn; returns its result, or None if dropped."""
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_turn(chat_id)
+            try:
+                return await make_call()
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+                logger.warning(f"Telegram rate limit hit for chat {chat_id}; retrying in {delay}s")
+            except TimedOut:
+                delay = 2 ** attempt
+                logger.warning(f"Telegram request timed out for chat {chat_id}; retrying in {delay}s")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+        
+        logger.error(f"Dropping Telegram message for chat {chat_id} after {self.max_attempts} attempts")
+        return None
+
+throttler = TelegramThrottler()
+
+# One HTTP session for the bot's lifetime, so API calls reuse kept-alive TLS connections
+HTTP_SESSION_KEY = "http"
+HTTP_CONNECTION_LIMIT = 20
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_TIMEOUT_SECONDS = 30
+
+# The backend (Render) cold-starts: gateway errors and timeouts are retried with exponential backoff,
+# and requests get a longer timeout until the backend has answered once
+API_RETRY_ATTEMPTS = 4
+API_RETRY_BASE_DELAY_SECONDS = 1.0
+API_RETRY_STATUSES = {502, 503, 504}
+API_COLD_START_TIMEOUT_SECONDS = 90
+SERVICE_WARMING_UP_MESSAGE = "The analysis service is warming up. Please try again in about 30 seconds."
+_backend_warm = False
+
+# API bodies are encoded and decoded with orjson when it is installed
+json_loads = orjson.loads if orjson is not None else json.loads
+
+def json_body(data) -> bytes:
+    """Serialize a request payload to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+async def api_request(session: aiohttp.ClientSession, method: str, url: str, **kwargs):
+    """
+    Call the backend, retrying gateway errors, connection errors and timeouts.
+    Returns (status, parsed JSON body or None); raises if the last attempt fails to connect.
+    """
+    global _backend_warm
+    for attempt in range(1, API_RETRY_ATTEMPTS + 1):
+        if not _backend_warm:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=API_COLD_START_TIMEOUT_SECONDS)
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status not in API_RETRY_STATUSES or attempt == API_RETRY_ATTEMPTS:
+                    if response.status not in API_RETRY_STATUSES:
+                        _backend_warm = True
+                    try:
+                        return response.status, json_loads(await response.read())
+                    except ValueError:
+                        return response.status, None
+                problem = f"status {response.status}"
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == API_RETRY_ATTEMPTS:
+                raise
+            problem = str(e) or type(e).__name__
+        
+        delay = API_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+        logger.warning(f"{method} {url} failed ({problem}); retry {attempt}/{API_RETRY_ATTEMPTS - 1} in {delay:g}s")
+        await asyncio.sleep(delay)
+
+# One WebSocket to the API for the bot's lifetime, reconnected with capped exponential backoff if it drops
+TASK_UPDATES_KEY = "task_updates"
+TASK_UPDATES_HEARTBEAT_SECONDS = 30
+TASK_UPDATES_MAX_RECONNECT_SECONDS = 60
+# Futures of the reviews awaiting a result, by task id; the listener resolves them as results arrive
+review_waiters: dict[str, asyncio.Future] = {}
+_task_updates_connected = False
+
+async def listen_for_task_updates(session: aiohttp.ClientSession) -> None:
+    """Receive finished review jobs from the API and hand each to whoever is waiting on its task id."""
+    global _task_updates_connected
+    delay = API_RETRY_BASE_DELAY_SECONDS
+    while True:
+        try:
+            async with session.ws_connect(TASK_UPDATES_WS_URL, heartbeat=TASK_UPDATES_HEARTBEAT_SECONDS) as ws:
+                _task_updates_connected = True
+                delay = API_RETRY_BASE_DELAY_SECONDS
+                logger.info("Connected to review task updates")
+                async for message in ws:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    try:
+                        job = json_loads(message.data)
+                    except ValueError:
+                        continue
+                    if not isinstance(job, dict):
+                        continue
+                    waiter = review_waiters.get(job.get("task_id"))
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(job)
+            problem = "connection closed"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            problem = str(e) or type(e).__name__
+        finally:
+            _task_updates_connected = False
+        
+        logger.warning(f"Review task updates unavailable ({problem}); reconnecting in {delay:g}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, TASK_UPDATES_MAX_RECONNECT_SECONDS)
+
+async def open_http_session(application: Application) -> None:
+    """Create the shared aiohttp session once the bot's event loop is running, and start listening for task updates."""
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT, keepalive_timeout=HTTP_KEEPALIVE_SECONDS),
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+    )
+    application.bot_data[HTTP_SESSION_KEY] = session
+    application.bot_data[TASK_UPDATES_KEY] = asyncio.create_task(listen_for_task_updates(session))
+
+async def close_http_session(application: Application) -> None:
+    """Stop listening for task updates and close the shared aiohttp session at shutdown."""
+    listener = application.bot_data.pop(TASK_UPDATES_KEY, None)
+    if listener is not None:
+        listener.cancel()
+        try:
+            await listener
+        except asyncio.CancelledError:
+            pass
+    session = application.bot_data.pop(HTTP_SESSION_KEY, None)
+    if session is not None:
+        await session.close()
+
+# Telegram caps callback_data at 64 bytes, so buttons carry a short id and the name is looked up here
+EVENTS_BY_ID_KEY = "events_by_id"
+
+def event_callback_id(event_name: str) -> str:
+    """Short, stable id for an event name (the same event always gets the same id)."""
+    return hashlib.blake2b(event_name.encode("utf-8"), digest_size=8).hexdigest()
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command."""
@@ -43,7 +238,7 @@ Commands:
 • /review - Select an event for analysis
 • /help - Show help information
     """
-    await update.message.reply_text(welcome_message)
+    await throttler.send(update.effective_chat.id, lambda: update.message.reply_text(welcome_message))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /help command."""
@@ -64,46 +259,81 @@ This bot helps you trigger performance reviews for your chess games.
 
 **Note:** Analysis may take a few minutes to complete. The detailed report will be generated and saved.
     """
-    await update.message.reply_text(help_message)
+    await throttler.send(update.effective_chat.id, lambda: update.message.reply_text(help_message))
+
+# Recent events change rarely, so bursts of /review commands share one fetch
+EVENTS_CACHE_TTL_SECONDS = 60
+_events_cache = {"events": None, "expires": 0.0}
+_events_lock = asyncio.Lock()
 
-async def fetch_recent_events():
+async def fetch_recent_events(session: aiohttp.ClientSession):
+    """Fetch recent events from the API, reusing a successful response for EVENTS_CACHE_TTL_SECONDS."""
+    async with _events_lock:
+        if _events_cache["events"] is not None and time.monotonic() < _events_cache["expires"]:
+            return _events_cache["events"]
+        
+        events = await request_recent_events(session)
+        if events is not None:
+            _events_cache["events"] = events
+            _events_cache["expires"] = time.monotonic() + EVENTS_CACHE_TTL_SECONDS
+        return events
+
+async def request_recent_events(session: aiohttp.ClientSession):
     """Fetch recent events from the API."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(EVENTS_ENDPOINT) as response:
-                if response.status == 200:
-                    events = await response.json()
-                    logger.info(f"Fetched {len(events)} events from API")
-                    return events
-                else:
-                    logger.error(f"API returned status {response.status}")
-                    return None
+        status, events = await api_request(session, "GET", EVENTS_ENDPOINT)
+        if status == 200:
+            logger.info(f"Fetched {len(events)} events from API")
+            return events
+        else:
+            logger.error(f"API returned status {status}")
+            return None
     except Exception as e:
         logger.error(f"Error fetching events: {e}")
         return None
 
+async def await_with_progress(coro, show_progress):
+    """
+    Await coro, calling show_progress() first if it hasn't finished within PROGRESS_MESSAGE_DELAY_SECONDS.
+    Fast answers (cache hits, an immediate 202) then cost the chat one message instead of two.
+    """
+    task = asyncio.ensure_future(coro)
+    done, _ = await asyncio.wait({task}, timeout=PROGRESS_MESSAGE_DELAY_SECONDS)
+    if not done:
+        await show_progress()
+    return await task
+
 async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /review command - show recent events as buttons."""
+    chat_id = update.effective_chat.id
+    thinking_message = None
+    
+    async def show_thinking():
+        nonlocal thinking_message
+        thinking_message = await throttler.send(
+            chat_id, lambda: update.message.reply_text("🔍 Fetching recent events...")
+        )
+    
+    async def respond(text, **kwargs):
+        # Replace the "thinking" message if one was sent, otherwise answer directly
+        if thinking_message is None:
+            return await throttler.send(chat_id, lambda: update.message.reply_text(text, **kwargs))
+        return await throttler.send(chat_id, lambda: thinking_message.edit_text(text, **kwargs))
+    
     try:
-        # Send "thinking" message
-        thinking_message = await update.message.reply_text("🔍 Fetching recent events...")
-        
         # Fetch events from API
-        events = await fetch_recent_events()
+        events = await await_with_progress(fetch_recent_events(context.bot_data[HTTP_SESSION_KEY]), show_thinking)
         
-        if not events:
-            await thinking_message.edit_text(
-                "❌ No recent events found or unable to connect to analysis service."
-            )
+        if events is None:
+            await respond(f"⏳ {SERVICE_WARMING_UP_MESSAGE}")
             return
         
         if len(events) == 0:
-            await thinking_message.edit_text(
-                "📭 No recent chess events available for analysis."
-            )
+            await respond("📭 No recent chess events available for analysis.")
             return
         
         # Create inline keyboard with event buttons
+        events_by_id = context.bot_data.setdefault(EVENTS_BY_ID_KEY, {})
         keyboard = []
         for event in events:
             event_name = event.get('event_name', 'Unknown Event')
@@ -113,15 +343,17 @@ async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             display_name = event_name[:40] + '...' if len(event_name) > 40 else event_name
             button_text = f"📅 {display_name} ({latest_date})"
             
-            # Use full event name as callback data
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"review:{event_name}")])
+            # Callback data carries the event's short id; the full name stays in bot_data
+            event_id = event_callback_id(event_name)
+            events_by_id[event_id] = event_name
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"review:{event_id}")])
         
         # Add cancel button
         keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="cancel")])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await thinking_message.edit_text(
+        await respond(
             "🏆 Select an event to analyze:\n\n"
             "Click on an event below to start the performance review analysis.",
             reply_markup=reply_markup
@@ -129,34 +361,99 @@ async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
     except Exception as e:
         logger.error(f"Error in review command: {e}")
-        await update.message.reply_text(
-            f"❌ Error loading events: {str(e)}"
-        )
+        error_text = f"❌ Error loading events: {e}"
+        await throttler.send(chat_id, lambda: update.message.reply_text(error_text))
 
-async def trigger_review_analysis(event_name: str):
+async def trigger_review_analysis(session: aiohttp.ClientSession, event_name: str):
     """Trigger the review analysis via API."""
     try:
         payload = {"event_name": event_name}
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                REVIEW_ENDPOINT,
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            ) as response:
-                result = await response.json()
-                
-                if response.status == 200:
-                    logger.info(f"Successfully triggered review for event: {event_name}")
-                    return result
-                else:
-                    logger.error(f"API error {response.status}: {result}")
-                    return None
+        status, result = await api_request(
+            session,
+            "POST",
+            REVIEW_ENDPOINT,
+            data=json_body(payload),
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if status in (200, 202):
+            logger.info(f"Successfully triggered review for event: {event_name}")
+            return result
+        else:
+            logger.error(f"API error {status}: {result}")
+            # Errors the API explains (e.g. an unknown event) are shown as-is
+            if isinstance(result, dict) and result.get('detail'):
+                return {"status": "error", "message": result['detail']}
+            return None
                     
     except Exception as e:
         logger.error(f"Error triggering review: {e}")
         return None
 
+async def fetch_review_status(session: aiohttp.ClientSession, task_id: str):
+    """Fetch the state of a queued review from the API."""
+    try:
+        status, job = await api_request(session, "GET", f"{REVIEW_STATUS_ENDPOINT}/{task_id}")
+        if status == 200:
+            return job
+        logger.error(f"Review status API returned status {status}")
+        return None
+    except Exception as e:
+        logger.error(f"Error fetching review status: {e}")
+        return None
+
+async def report_review_result(session: aiohttp.ClientSession, query, event_name: str, task_id: str) -> None:
+    """Wait for a queued review to finish, then replace the progress message with its outcome."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REVIEW_POLL_TIMEOUT_SECONDS
+    waiter = review_waiters[task_id] = loop.create_future()
+    result = None
+    try:
+        while loop.time() < deadline:
+            # The pushed result normally arrives first; polling covers pushes missed while disconnected
+            poll_seconds = REVIEW_FALLBACK_POLL_SECONDS if _task_updates_connected else REVIEW_POLL_SECONDS
+            try:
+                job = await asyncio.wait_for(asyncio.shield(waiter), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                job = await fetch_review_status(session, task_id)
+            if job and job.get('state') == 'finished':
+                result = job.get('result')
+                break
+    finally:
+        review_waiters.pop(task_id, None)
+    
+    try:
+        if result and result.get('status') == 'success':
+            games_count = result.get('games_analyzed', 'unknown')
+            report_file = result.get('report_filename', 'performance_review.txt')
+            
+            success_message = f"""
+✅ **Analysis Completed Successfully!**
+
+📊 Event: {event_name}
+🎯 Games Analyzed: {games_count}
+📝 Report File: {report_file}
+
+The detailed performance review has been generated and saved.
+            """
+            
+            await throttler.send(query.message.chat_id, lambda: query.edit_message_text(success_message))
+        else:
+            if result:
+                error_msg = result.get('message', 'Unknown error')
+            else:
+                error_msg = 'Timed out waiting for the analysis service'
+            
+            await throttler.send(query.message.chat_id, lambda: query.edit_message_text(
+                f"❌ Analysis Failed\n\n"
+                f"Event: {event_name}\n"
+                f"Error: {error_msg}\n\n"
+                "Please try again later or check if the event has available games."
+            ))
+    except Exception as e:
+        logger.error(f"Error reporting review result: {e}")
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button clicks from inline keyboard."""
     query = update.callback_query
@@ -166,58 +463,58 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         callback_data = query.data
         
         if callback_data == "cancel":
-            await query.edit_message_text("❌ Analysis cancelled.")
+            await throttler.send(query.message.chat_id, lambda: query.edit_message_text("❌ Analysis cancelled."))
             return
         
         if callback_data.startswith("review:"):
-            event_name = callback_data[7:]  # Remove "review:" prefix
+            event_name = context.bot_data.get(EVENTS_BY_ID_KEY, {}).get(callback_data[7:])  # Remove "review:" prefix
+            if event_name is None:
+                await throttler.send(query.message.chat_id, lambda: query.edit_message_text(
+                    "⌛ This event list has expired. Use /review to load it again."
+                ))
+                return
             
-            # Update message to show processing
-            await query.edit_message_text(
-                f"⚙️ Starting analysis for event: {event_name}\n\nThis may take a few minutes. Please wait..."
+            # Trigger the review, showing progress only if the backend is slow to accept it
+            session = context.bot_data[HTTP_SESSION_KEY]
+            result = await await_with_progress(
+                trigger_review_analysis(session, event_name),
+                lambda: throttler.send(query.message.chat_id, lambda: query.edit_message_text(
+                    f"⚙️ Starting analysis for event: {event_name}\n\nThis may take a few minutes. Please wait..."
+                ))
             )
-
             
-            # Trigger the review
-            result = await trigger_review_analysis(event_name)
-            
-            if result and result.get('status') == 'success':
-                games_count = result.get('games_analyzed', 'unknown')
-                report_file = result.get('report_filename', 'performance_review.txt')
-                
-                success_message = f"""
-✅ **Analysis Started Successfully!**
-
-📊 Event: {event_name}
-🎯 Games Analyzed: {games_count}
-📝 Report File: {report_file}
-
-The detailed performance review is being generated. The report will be saved and may trigger additional notifications when complete.
-                """
+            if result and result.get('status') == 'queued':
+                await throttler.send(query.message.chat_id, lambda: query.edit_message_text(
+                    f"⏳ Analysis queued for event: {event_name}\n\n"
+                    "This message will be updated when the review is complete."
+                ))
                 
-                await query.edit_message_text(success_message)
-
+                # Poll in the background so the bot keeps handling other updates meanwhile
+                context.application.create_task(
+                    report_review_result(session, query, event_name, result['task_id'])
+                )
                 
             else:
-                error_msg = result.get('message', 'Unknown error') if result else 'Failed to connect to analysis service'
+                error_msg = result.get('message', 'Unknown error') if result else SERVICE_WARMING_UP_MESSAGE
                 
-                await query.edit_message_text(
+                await throttler.send(query.message.chat_id, lambda: query.edit_message_text(
                     f"❌ Analysis Failed\n\n"
                     f"Event: {event_name}\n"
                     f"Error: {error_msg}\n\n"
                     "Please try again later or check if the event has available games."
-                )
+                ))
 
         else:
-            await query.edit_message_text("❓ Unknown action. Please try again.")
+            await throttler.send(query.message.chat_id, lambda: query.edit_message_text("❓ Unknown action. Please try again."))
             
     except Exception as e:
         logger.error(f"Error in button callback: {e}")
-        await query.edit_message_text(
+        error_text = (
             f"❌ Error processing request\n\n"
-            f"Details: {str(e)}\n\n"
+            f"Details: {e}\n\n"
             "Please try again later."
         )
+        await throttler.send(query.message.chat_id, lambda: query.edit_message_text(error_text))
 
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -227,9 +524,9 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Try to notify the user if possible
     if update and update.effective_message:
         try:
-            await update.effective_message.reply_text(
+            await throttler.send(update.effective_message.chat_id, lambda: update.effective_message.reply_text(
                 "❌ An unexpected error occurred. Please try again later."
-            )
+            ))
         except Exception:
             pass  # Ignore if we can't send the error message
 
@@ -239,7 +536,13 @@ def main():
     
     try:
         # Create application
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(open_http_session)
+            .post_shutdown(close_http_session)
+            .build()
+        )
         
         # Add command handlers
         application.add_handler(CommandHandler("start", start_command))
@@ -2,68 +2,160 @@
 Utility functions for MAIgnus_CAIrlsen chess analysis bot.
 """
 import os
+import json
 import datetime
 import chess.pgn
-import io
 import sys
+import hashlib
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import asyncio
 
-from src.config import DATA_DIR, CHESS_USERNAME
+try:
+    import uvloop  # Optional: faster event loop where available (not supported on Windows)
+except ImportError:
+    uvloop = None
+
+try:
+    import orjson  # Optional: much faster JSON serialization
+except ImportError:
+    orjson = None
+
+from src.config import DATA_DIR, GPT_CACHE_DIR, CHESS_USERNAME
+
+# One queue-backed logger per log file; disk writes happen on a listener thread
+# through a handler that keeps the file open and rotates it at LOG_MAX_BYTES
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+_file_loggers = {}
+_file_loggers_lock = threading.Lock()
+
+def _get_file_logger(log_file):
+    """
+    Return a logger whose records are written to log_file by a background QueueListener.
+    """
+    logger = _file_loggers.get(log_file)
+    if logger is not None:
+        return logger
+
+    with _file_loggers_lock:
+        logger = _file_loggers.get(log_file)
+        if logger is None:
+            log_queue = queue.SimpleQueue()
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+            )
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            listener = logging.handlers.QueueListener(log_queue, file_handler)
+            listener.start()
+            atexit.register(listener.stop)
+
+            name = os.path.splitext(os.path.basename(log_file))[0]
+            logger = logging.getLogger(f"maignus.{name}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            _file_loggers[log_file] = logger
+    return logger
+
+# Text stand-ins for emojis on consoles that can't encode them (e.g. legacy Windows code pages)
+_EMOJI_TABLE = str.maketrans({
+    "\U0001f680": "[ROCKET]",  # 🚀
+    "\U0001f4e5": "[INBOX]",   # 📥
+    "\U0001f9e0": "[BRAIN]",   # 🧠
+    "\U0001f4e7": "[EMAIL]",   # 📧
+    "\U0001f6a8": "[ALERT]",   # 🚨
+    "\u2714": "[CHECK]",       # ✔
+    "\u2705": "[CHECK]",       # ✅
+    "\u274c": "[CROSS]"        # ❌
+})
+_CONSOLE_ENCODING = getattr(sys.stdout, "encoding", None) or "ascii"
+_CONSOLE_IS_UTF = _CONSOLE_ENCODING.lower().replace("-", "").startswith("utf")
 
 def log(message, log_file):
     """
     Write timestamped log message to specified log file and print to console.
     Handles Unicode characters safely for Windows console.
     """
-    timestamp = datetime.datetime.now()
+    timestamp = datetime.datetime.now().isoformat(sep=" ", timespec="milliseconds")
     full_message = f"[{timestamp}] {message}"
     
-    # Write to console safely, handling Unicode errors
-    try:
+    # Write to console safely: emojis become text on consoles that can't encode them
+    if _CONSOLE_IS_UTF:
         print(full_message)
-    except UnicodeEncodeError:
-        # Replace emojis with text descriptions for console output
-        safe_message = full_message
-        emoji_replacements = {
-            "\U0001f680": "[ROCKET]",  # 🚀
-            "\U0001f4e5": "[INBOX]",   # 📥
-            "\U0001f9e0": "[BRAIN]",   # 🧠
-            "\U0001f4e7": "[EMAIL]",   # 📧
-            "\U0001f6a8": "[ALERT]",   # 🚨
-            "\u2714": "[CHECK]",       # ✔
-            "\u274c": "[CROSS]"        # ❌
-        }
-        
-        for emoji, replacement in emoji_replacements.items():
-            safe_message = safe_message.replace(emoji, replacement)
-            
-        print(safe_message)
+    else:
+        safe_message = full_message.translate(_EMOJI_TABLE)
+        print(safe_message.encode(_CONSOLE_ENCODING, errors="replace").decode(_CONSOLE_ENCODING))
     
-    # Always write the full message with emojis to the log file
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(full_message + "\n")
+    # Always write the full message with emojis to the log file (off the calling thread)
+    _get_file_logger(log_file).info(full_message)
+
+def run_async(coro):
+    """
+    Run a coroutine to completion, on uvloop when it is installed.
+    """
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+def json_bytes(data):
+    """
+    Serialize data as indented UTF-8 JSON, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+def write_bytes(path, data):
+    """
+    Write a fully prepared buffer to path with a single write call on a raw file descriptor.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
 def get_latest_pgn_path():
     """
-    Find the most recently modified PGN file in the data directory.
+    Find the most recently modified PGN file in the data directory, in a single directory scan.
     """
-    if not os.path.exists(DATA_DIR):
-        return None
-        
-    pgn_files = sorted(
-        [f for f in os.listdir(DATA_DIR) if f.endswith(".pgn")],
-        key=lambda f: os.path.getmtime(os.path.join(DATA_DIR, f)),
-        reverse=True,
-    )
-    return os.path.join(DATA_DIR, pgn_files[0]) if pgn_files else None
+    with os.scandir(DATA_DIR) as entries:
+        latest = max(
+            (entry for entry in entries if entry.name.endswith(".pgn") and entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+            default=None
+        )
+    return latest.path if latest else None
 
 def load_pgn_game(pgn_path):
     """
-    Load a chess game from a PGN file.
+    Load a chess game from a PGN file, parsing straight from the file handle.
     """
     with open(pgn_path, "r", encoding="utf-8") as f:
-        pgn_text = f.read()
-        
-    return chess.pgn.read_game(io.StringIO(pgn_text)), pgn_text
+        return chess.pgn.read_game(f)
+
+def read_pgn_text(pgn_path):
+    """
+    Read the raw PGN text, for callers that embed it (e.g. the game report).
+    """
+    with open(pgn_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def get_mainline_moves(game):
+    """
+    Return the game's mainline moves as a list, walking the move tree only once per game.
+    """
+    moves = getattr(game, "_cached_mainline", None)
+    if moves is None:
+        moves = list(game.mainline_moves())
+        game._cached_mainline = moves
+    return moves
 
 def extract_player_info(game, username=CHESS_USERNAME):
     """
@@ -87,32 +179,44 @@ def extract_player_info(game, username=CHESS_USERNAME):
             "color": "Black"
         }
 
+# Map common move sequences to opening names
+OPENINGS = {
+    ("e4", "c5", "Nf3"): "Sicilian Defense",
+    ("d4", "d5", "c4"): "Queen's Gambit",
+    ("e4", "e5"): "Open Game",
+    ("d4", "Nf6"): "Indian Game",
+    ("e4", "c6", "Nc3"): "Caro-Kann Defense",
+    ("e4", "e6"): "French Defense",
+    ("Nf3", "Nf6", "c4"): "English Opening",
+}
+
+# Trie of the sequences above, one SAN per level; "__name__" marks where a sequence ends
+_OPENING_TRIE = {}
+for _sequence, _name in OPENINGS.items():
+    _node = _OPENING_TRIE
+    for _san in _sequence:
+        _node = _node.setdefault(_san, {})
+    _node["__name__"] = _name
+del _sequence, _name, _node, _san
+
 def infer_opening(game):
     """
     Infer the opening name from the first few moves if not provided in headers.
     """
+    # Walk the trie alongside the game, computing SAN only while a longer sequence can still match
     board = game.board()
-    moves = []
-    for move in game.mainline_moves():
-        moves.append(board.san(move))
+    node = _OPENING_TRIE
+    name = None
+    for move in get_mainline_moves(game):
+        node = node.get(board.san(move))
+        if node is None:
+            break
+        name = node.get("__name__", name)
+        if node.keys() <= {"__name__"}:
+            break  # no longer sequence continues from here
         board.push(move)
-
-    # Map common sequences to opening names
-    openings = {
-        ("e4", "c5", "Nf3"): "Sicilian Defense",
-        ("d4", "d5", "c4"): "Queen's Gambit",
-        ("e4", "e5"): "Open Game",
-        ("d4", "Nf6"): "Indian Game",
-        ("e4", "c6", "Nc3"): "Caro-Kann Defense",
-        ("e4", "e6"): "French Defense",
-        ("Nf3", "Nf6", "c4"): "English Opening",
-    }
-    
-    for sequence, name in openings.items():
-        if moves[:len(sequence)] == list(sequence):
-            return name
             
-    return "Unknown Opening"
+    return name or "Unknown Opening"
 
 def extract_game_metadata(game):
     """
@@ -127,5 +231,34 @@ def extract_game_metadata(game):
         "Time Control": game.headers.get("TimeControl", "N/A"),
         "Opening": opening_name,
         "Result": game.headers.get("Result", "N/A"),
-        "Moves": len(list(game.mainline_moves()))
-    }
\ No newline at end of file
+        "Moves": len(get_mainline_moves(game))
+    }
+
+# Content-addressed store of GPT responses (in GPT_CACHE_DIR), so identical requests skip the API
+def gpt_cache_key(*parts):
+    """
+    Build a cache key from everything that determines a GPT response (model, prompts, parameters).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+def get_cached_gpt_response(key):
+    """
+    Return the cached GPT response for key, or None if there isn't one.
+    """
+    try:
+        return (GPT_CACHE_DIR / f"{key}.txt").read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+def cache_gpt_response(key, text):
+    """
+    Store a GPT response under key.
+    """
+    path = GPT_CACHE_DIR / f"{key}.txt"
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)